@@ -0,0 +1,323 @@
+import os
+import io
+import sys
+import json
+import time
+import pickle
+import shutil
+import platform
+import subprocess
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+
+# Offline end-to-end benchmarks for all five tasks. Google embeddings, Groq
+# and Serper are replaced by the stand-ins in stubs.py, every cache starts
+# empty in a scratch directory, and results can be saved as a JSON baseline
+# and compared against later runs.
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLED_PDFS = os.path.join(REPO_ROOT, "task_1", "pdfs")
+BUNDLED_KNOWLEDGE_BASE = os.path.join(REPO_ROOT, "task_3", "knowledge_base")
+STUB_PORT = 8799
+STARTUP_RERUNS = 20
+# A metric this much worse than the baseline counts as a regression
+TOLERANCE = 0.10
+
+WORK_DIR = tempfile.mkdtemp(prefix="benchmarks_")
+# Caches go to the scratch directory, and the stubs need no rate limiting
+os.environ.update({
+    "GROQ_API_KEY": "stub", "GOOGLE_API_KEY": "stub", "SERPER_API_KEY": "stub",
+    "SERPER_URL": f"http://127.0.0.1:{STUB_PORT}/search",
+    "EMBEDDING_CACHE_PATH": os.path.join(WORK_DIR, "embeddings.sqlite"),
+    "SUMMARY_CACHE_PATH": os.path.join(WORK_DIR, "summaries.sqlite"),
+    "HTTP_CACHE_PATH": os.path.join(WORK_DIR, "http.sqlite"),
+    "EMBEDDING_REQUESTS_PER_MINUTE": "1000000",
+    "SUMMARY_TOKENS_PER_MINUTE": "1000000000",
+    "LLM_REQUESTS_PER_MINUTE": "1000000",
+})
+for folder in ("", "task_1", "task_3", "task_4", "task_5"):
+    sys.path.append(os.path.join(REPO_ROOT, folder))
+
+import fitz  # PyMuPDF
+import langchain_groq
+import langchain_google_genai
+from stubs import HashEmbeddings, SearchStubServer, stub_chat_model, synthetic_text
+
+
+class Results:
+    """Named metrics with their unit and which direction is better."""
+
+    def __init__(self):
+        self.metrics = {}
+
+    def record(self, name, value, unit, higher_is_better=False):
+        self.metrics[name] = {"value": round(float(value), 4), "unit": unit,
+                              "higher_is_better": higher_is_better}
+        print(f"  {name:42}{value:12.3f} {unit}")
+
+
+def percentiles(results, prefix, seconds):
+    milliseconds = np.array(seconds) * 1000
+    for p in (50, 95, 99):
+        results.record(f"{prefix}_p{p}_ms", np.percentile(milliseconds, p), "ms")
+
+
+def scaled_pdf(paths, repeat, out_path):
+    large = fitz.open()
+    for _ in range(repeat):
+        for path in paths:
+            with fitz.open(path) as doc:
+                large.insert_pdf(doc)
+    large.save(out_path)
+    return out_path
+
+
+def bench_extraction(results, scale):
+    from task_1 import iter_pages
+
+    print("task_1 extraction")
+    pdfs = sorted(os.path.join(BUNDLED_PDFS, f) for f in os.listdir(BUNDLED_PDFS)
+                  if f.lower().endswith(".pdf"))
+    for label, paths in (
+            ("bundled", pdfs),
+            ("scaled", [scaled_pdf(pdfs, scale, os.path.join(WORK_DIR, "scaled.pdf"))])):
+        start = time.perf_counter()
+        pages = sum(1 for path in paths for _ in iter_pages(path))
+        results.record(f"extraction_{label}_pages_per_s",
+                       pages / (time.perf_counter() - start), "pages/s", True)
+
+
+def synthetic_corpus(folder, files, words_per_file):
+    os.makedirs(folder, exist_ok=True)
+    for i in range(files):
+        with open(os.path.join(folder, f"doc_{i}.txt"), "w", encoding="utf-8") as f:
+            f.write(synthetic_text(words_per_file, seed=i))
+    return folder
+
+
+def bench_rag(results, scale, queries):
+    import task_3
+    from common.hybrid_retrieval import HybridRetriever, build_bm25_index
+
+    print("task_3 RAG (task_2 shares the same indexing and retrieval code)")
+    questions = [synthetic_text(12, seed=1000 + i) for i in range(queries)] + \
+        [f"policy 1{i:03d}" for i in range(queries // 4)]
+    corpora = (
+        ("bundled", BUNDLED_KNOWLEDGE_BASE),
+        ("scaled", synthetic_corpus(os.path.join(WORK_DIR, "corpus"), 20 * scale, 2000)),
+    )
+    for label, folder in corpora:
+        # Cold embedding cache, so the build embeds every chunk
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.environ["EMBEDDING_CACHE_PATH"])
+        start = time.perf_counter()
+        vectorstore, chunks = task_3.vector_embeddings(
+            task_3.load_documents_from_folder(folder))
+        lexical_index = build_bm25_index(vectorstore)
+        build_seconds = time.perf_counter() - start
+        results.record(f"index_build_{label}_s", build_seconds, "s")
+        results.record(f"index_build_{label}_chunks_per_s",
+                       len(chunks) / build_seconds, "chunks/s", True)
+
+        retriever = HybridRetriever(vector_store=vectorstore, lexical_index=lexical_index)
+        seconds = []
+        for question in questions:
+            start = time.perf_counter()
+            retriever.invoke(question)
+            seconds.append(time.perf_counter() - start)
+        percentiles(results, f"retrieval_{label}", seconds)
+
+    qa_chain = task_3.build_qa_chain(vectorstore, lexical_index)
+    seconds = []
+    for question in questions[:queries // 2]:
+        start = time.perf_counter()
+        qa_chain.invoke({"query": question})
+        seconds.append(time.perf_counter() - start)
+    percentiles(results, "rag_answer_scaled", seconds)
+
+
+def bench_summarization(results, scale):
+    import task4
+
+    print("task4 summarization")
+    pdf = os.path.join(BUNDLED_KNOWLEDGE_BASE, "BERT.pdf")
+    for label, path in (
+            ("bundled", pdf),
+            ("scaled", scaled_pdf([pdf], scale, os.path.join(WORK_DIR, "summary.pdf")))):
+        pages = task4.load_pdf_pages(path)
+        start = time.perf_counter()
+        task4.extractive_summary("".join(pages))
+        results.record(f"extractive_{label}_s", time.perf_counter() - start, "s")
+
+        tracker = task4.UsageTracker()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            task4.abstractive_summary(task4.split_pages(pages), tracker, use_cache=False)
+        results.record(f"abstractive_{label}_s", time.perf_counter() - start, "s")
+        results.record(f"abstractive_{label}_llm_calls", tracker.calls, "calls")
+        results.record(f"abstractive_{label}_tokens",
+                       tracker.prompt_tokens + tracker.completion_tokens, "tokens")
+
+
+def bench_workflow(results, topics, server):
+    import task5
+
+    print("task5 agent workflow")
+    # Built on first use; startup is measured separately by bench_startup
+    task5.get_agent_executor1(), task5.get_agent_executor2(), task5.get_report_chain()
+    cwd = os.getcwd()
+    os.chdir(WORK_DIR)
+    try:
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            task5.run_batch_workflow([f"Company {i}" for i in range(topics)])
+        wall_seconds = time.perf_counter() - start
+    finally:
+        os.chdir(cwd)
+    results.record("workflow_wall_s", wall_seconds, "s")
+    results.record("workflow_topics_per_min", topics * 60 / wall_seconds, "topics/min", True)
+    results.record("workflow_http_requests", server.requests, "requests")
+
+
+# Run in a fresh interpreter each, so nothing is imported yet: the first
+# AppTest run is a cold start, later runs are reruns as on every widget change
+APP_STARTUP_SCRIPT = """
+import sys, json, time, statistics
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=300)
+start = time.perf_counter()
+app.run()
+cold = time.perf_counter() - start
+reruns = []
+for _ in range(int(sys.argv[2])):
+    start = time.perf_counter()
+    app.run()
+    reruns.append(time.perf_counter() - start)
+print(json.dumps({"cold": cold, "rerun": statistics.median(reruns),
+                  "errors": [str(e.value) for e in app.exception]}))
+"""
+IMPORT_SCRIPT = """
+import sys, json, time
+start = time.perf_counter()
+__import__(sys.argv[1])
+print(json.dumps({"import": time.perf_counter() - start}))
+"""
+
+
+def run_script(script, args, cwd):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path))
+    output = subprocess.run(
+        [sys.executable, "-c", script, *map(str, args)], cwd=cwd, env=env,
+        capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def saved_knowledge_base(folder):
+    # A small knowledge base in task_2's on-disk layout, so the app opens it
+    from langchain_community.vectorstores import FAISS
+    from common.hybrid_retrieval import build_bm25_index
+    from task_3 import iter_file_pages
+
+    kb_dir = os.path.join(folder, "faiss_index")
+    pages = list(iter_file_pages(os.path.join(BUNDLED_KNOWLEDGE_BASE, "BERT.pdf")))
+    vector_store = FAISS.from_documents(pages, HashEmbeddings())
+    vector_store.save_local(kb_dir)
+    with open(os.path.join(kb_dir, "bm25.pkl"), "wb") as f:
+        pickle.dump(build_bm25_index(vector_store), f)
+    with open(os.path.join(kb_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"BERT.pdf": list(vector_store.index_to_docstore_id.values())}, f)
+    return folder
+
+
+def bench_startup(results):
+    print("startup (task_2 app and task5 import, fresh interpreters)")
+    app_dir = saved_knowledge_base(os.path.join(WORK_DIR, "app"))
+    timings = run_script(APP_STARTUP_SCRIPT, [
+        os.path.join(REPO_ROOT, "task_2", "app.py"), STARTUP_RERUNS], app_dir)
+    if timings["errors"]:
+        raise RuntimeError(f"task_2 app failed: {timings['errors']}")
+    results.record("app_cold_start_s", timings["cold"], "s")
+    results.record("app_rerun_ms", timings["rerun"] * 1000, "ms")
+    timings = run_script(IMPORT_SCRIPT, ["task5"], WORK_DIR)
+    results.record("task5_import_s", timings["import"], "s")
+
+
+def compare(results, baseline_path, tolerance=TOLERANCE):
+    # Prints every metric next to the baseline; returns the regressions
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)["metrics"]
+    regressions = []
+    print(f"\nCompared with {baseline_path} (tolerance {tolerance:.0%}):")
+    for name, metric in results.metrics.items():
+        if name not in baseline or not baseline[name]["value"]:
+            continue
+        change = metric["value"] / baseline[name]["value"] - 1
+        worse = -change if metric["higher_is_better"] else change
+        flag = "REGRESSION" if worse > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"  {name:42}{baseline[name]['value']:12.3f} -> "
+              f"{metric['value']:12.3f} ({change:+.1%}) {flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Offline benchmarks with stub embeddings, LLM and search")
+    parser.add_argument("--scale", type=int, default=5,
+                        help="size multiplier for the synthetic and repeated corpora")
+    parser.add_argument("--queries", type=int, default=200,
+                        help="retrieval queries per corpus")
+    parser.add_argument("--topics", type=int, default=6,
+                        help="topics in the agent workflow batch")
+    parser.add_argument("--llm-latency", type=float, default=0.05,
+                        help="seconds the stub chat model waits per call")
+    parser.add_argument("--llm-output-tokens", type=int, default=64)
+    parser.add_argument("--search-latency", type=float, default=0.05,
+                        help="seconds the stub search server waits per request")
+    parser.add_argument("--only", nargs="+",
+                        choices=["extraction", "rag", "summarization", "workflow",
+                                 "startup"],
+                        help="run only these benchmarks")
+    parser.add_argument("--output", default="benchmark_results.json",
+                        help="where to write this run's results")
+    parser.add_argument("--compare", help="earlier results file to compare against; "
+                        "exits with status 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=TOLERANCE)
+    args = parser.parse_args()
+
+    # Every task module builds its clients from these classes at import
+    langchain_groq.ChatGroq = stub_chat_model(args.llm_latency, args.llm_output_tokens)
+    langchain_google_genai.GoogleGenerativeAIEmbeddings = HashEmbeddings
+    server = SearchStubServer(port=STUB_PORT, latency_seconds=args.search_latency).start()
+
+    selected = args.only or ["extraction", "rag", "summarization", "workflow", "startup"]
+    results = Results()
+    try:
+        if "extraction" in selected:
+            bench_extraction(results, args.scale)
+        if "rag" in selected:
+            bench_rag(results, args.scale, args.queries)
+        if "summarization" in selected:
+            bench_summarization(results, args.scale)
+        if "workflow" in selected:
+            bench_workflow(results, args.topics, server)
+        if "startup" in selected:
+            bench_startup(results)
+    finally:
+        shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "settings": vars(args),
+            "metrics": results.metrics,
+        }, f, indent=4)
+    print(f"\nResults saved to {args.output}")
+
+    if args.compare and compare(results, args.compare, args.tolerance):
+        sys.exit(1)
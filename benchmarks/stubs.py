@@ -0,0 +1,165 @@
+# Local stand-ins for Google embeddings, Groq chat models and Serper search,
+# so every task can be timed offline and reproducibly
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import numpy as np
+from aiohttp import web
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from common.hybrid_retrieval import tokenize
+
+VOCABULARY = ("market revenue growth product vehicle battery electric policy "
+              "premium coverage claim model training language attention layer "
+              "token dataset benchmark supplier factory price share segment "
+              "customer export demand capacity launch quarter profit margin").split()
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic bag-of-words vectors: each token hashed to a signed bucket.
+
+    Texts sharing words get similar vectors, so retrieval results are
+    meaningful, and the same text always gets the same vector.
+    """
+
+    def __init__(self, dim=768, model=None, **kwargs):
+        self.dim = dim
+
+    def embed_query(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for token in tokenize(text):
+            digest = int.from_bytes(hashlib.blake2b(token.encode("utf-8"),
+                                                    digest_size=8).digest(), "little")
+            vector[digest % self.dim] += 1.0 if digest >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+class StubChatModel(BaseChatModel):
+    """Chat model that sleeps `latency_seconds` and answers `output_tokens` words.
+
+    Reports token usage like Groq does. When tools are bound it calls the
+    first one once, with the conversation's first line as input, and answers
+    after the tool result comes back, so tool-using agents run their loop.
+    """
+
+    latency_seconds: float = 0.0
+    output_tokens: int = 64
+    model_name: str = "stub"
+    model_config = {"extra": "ignore"}
+
+    @property
+    def _llm_type(self):
+        return "stub-chat"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _generate(self, messages, stop=None, run_manager=None, tools=None, **kwargs):
+        time.sleep(self.latency_seconds)
+        prompt = "\n".join(str(message.content) for message in messages)
+        prompt_tokens = len(prompt.split())
+
+        if tools and not any(isinstance(message, ToolMessage) for message in messages):
+            function = tools[0]["function"]
+            argument = next(iter(function["parameters"].get("properties", {})), "query")
+            line = next((line.strip() for line in prompt.splitlines() if line.strip()), "")
+            message = AIMessage(content="", tool_calls=[{
+                "name": function["name"], "args": {argument: line[:200]},
+                "id": f"call_{hashlib.sha1(prompt.encode()).hexdigest()[:12]}"}])
+            completion_tokens = 10
+        else:
+            rng = random.Random(prompt)
+            message = AIMessage(content=" ".join(
+                rng.choice(VOCABULARY) for _ in range(self.output_tokens)))
+            completion_tokens = self.output_tokens
+
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                 "total_tokens": prompt_tokens + completion_tokens}
+        return ChatResult(generations=[ChatGeneration(message=message)],
+                          llm_output={"token_usage": usage})
+
+
+def stub_chat_model(latency_seconds=0.0, output_tokens=64):
+    # A drop-in for the ChatGroq class: ignores API keys and model settings
+    # but keeps the callbacks, so traces include the stub's calls
+    def factory(*args, callbacks=None, **kwargs):
+        return StubChatModel(latency_seconds=latency_seconds, output_tokens=output_tokens,
+                             callbacks=callbacks)
+    return factory
+
+
+def synthetic_text(words, seed):
+    rng = random.Random(seed)
+    sentences = []
+    while words > 0:
+        length = rng.randint(8, 20)
+        sentences.append(" ".join(rng.choice(VOCABULARY) for _ in range(length)).capitalize() + ".")
+        words -= length
+    return " ".join(sentences)
+
+
+class SearchStubServer:
+    """Serper-compatible search endpoint plus article pages, on a local port.
+
+    Every response waits `latency_seconds`; searches return `results` links
+    to /article/<n> pages with a few paragraphs of synthetic text.
+    """
+
+    def __init__(self, port=8799, latency_seconds=0.05, results=5):
+        self.port = port
+        self.latency_seconds = latency_seconds
+        self.results = results
+        self.requests = 0
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.serve, daemon=True)
+
+    @property
+    def search_url(self):
+        return f"http://127.0.0.1:{self.port}/search"
+
+    async def search(self, request):
+        self.requests += 1
+        await self.sleep()
+        query = (await request.json()).get("q", "")
+        seed = int(hashlib.sha1(query.encode("utf-8")).hexdigest(), 16) % 10000
+        return web.json_response({"organic": [
+            {"title": f"Result {i}", "link": f"http://127.0.0.1:{self.port}/article/{seed + i}"}
+            for i in range(self.results)]})
+
+    async def article(self, request):
+        self.requests += 1
+        await self.sleep()
+        seed = int(request.match_info["number"])
+        paragraphs = "".join(f"<p>{synthetic_text(60, seed * 10 + i)}</p>" for i in range(6))
+        return web.Response(text=f"<html><body>{paragraphs}</body></html>",
+                            content_type="text/html")
+
+    async def sleep(self):
+        await asyncio.sleep(self.latency_seconds)
+
+    def serve(self):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        app = web.Application()
+        app.router.add_post("/search", self.search)
+        app.router.add_get("/article/{number}", self.article)
+        runner = web.AppRunner(app)
+        loop.run_until_complete(runner.setup())
+        loop.run_until_complete(web.TCPSite(runner, "127.0.0.1", self.port).start())
+        self.ready.set()
+        loop.run_forever()
+
+    def start(self):
+        self.thread.start()
+        self.ready.wait()
+        return self
@@ -0,0 +1,134 @@
+# Approximate-nearest-neighbor FAISS indexes (IVF, HNSW, product quantization)
+# for large knowledge bases, shared by task_2 (app.py) and task_3 (task_3.py)
+import os
+import math
+import numpy as np
+import faiss
+
+# flat (exact), ivf, ivfpq or hnsw
+INDEX_TYPE = os.getenv("VECTOR_INDEX", "flat")
+# Search-time knobs: IVF lists probed and HNSW candidate list size
+NPROBE = int(os.getenv("VECTOR_INDEX_NPROBE", "16"))
+EF_SEARCH = int(os.getenv("VECTOR_INDEX_EF_SEARCH", "64"))
+# Vectors sampled for training IVF centroids and PQ codebooks
+TRAIN_SAMPLE = int(os.getenv("VECTOR_INDEX_TRAIN_SAMPLE", "100000"))
+PQ_SUBVECTORS = 64
+HNSW_NEIGHBORS = 32
+# Below this many vectors an exact flat index is small and fast enough
+MIN_ANN_VECTORS = 10000
+ADD_BATCH_SIZE = 100000
+# A saved index is updated in place and only retrained once its vector count
+# has grown or shrunk this many times from the count it was trained on
+RETRAIN_FACTOR = float(os.getenv("VECTOR_INDEX_RETRAIN_FACTOR", "2"))
+
+
+def ivf_lists(count):
+    # ~4 * sqrt(n) lists, with at least 39 training points per list
+    return max(1, min(int(4 * math.sqrt(count)), count // 39))
+
+
+def pq_subvectors(dim, wanted=PQ_SUBVECTORS):
+    # PQ needs a subvector count that divides the dimension
+    return max(m for m in range(1, min(wanted, dim) + 1) if dim % m == 0)
+
+
+def factory_string(index_type, dim, count):
+    if index_type == "flat":
+        return "Flat"
+    if index_type == "ivf":
+        return f"IVF{ivf_lists(count)},Flat"
+    if index_type == "ivfpq":
+        # "np": skip polysemous training, which only polysemous search uses
+        return f"IVF{ivf_lists(count)},PQ{pq_subvectors(dim)}np"
+    if index_type == "hnsw":
+        return f"HNSW{HNSW_NEIGHBORS}"
+    raise ValueError(f"Unknown vector index type: {index_type}")
+
+
+def set_search_params(index, nprobe=NPROBE, ef_search=EF_SEARCH):
+    # No-op for parameters the index does not have (e.g. nprobe on HNSW)
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass
+    return index
+
+
+def build_index(vectors, index_type=INDEX_TYPE, train_sample=TRAIN_SAMPLE,
+                nprobe=NPROBE, ef_search=EF_SEARCH, seed=0, ids=None,
+                min_vectors=MIN_ANN_VECTORS):
+    # L2 metric, like the flat index LangChain's FAISS store builds. Vectors
+    # keep their positions, so index_to_docstore_id stays valid, unless ids
+    # are given: then they are keyed by those ids, for add_with_ids/remove_ids.
+    # Fewer than min_vectors vectors get a flat index (see index_kind)
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    count, dim = vectors.shape
+    if count < min_vectors:
+        index_type = "flat"
+
+    description = factory_string(index_type, dim, count)
+    if ids is not None and not description.startswith("IVF"):
+        # IVF lists store ids themselves; flat and HNSW need an id map
+        description = "IDMap2," + description
+    index = faiss.index_factory(dim, description, faiss.METRIC_L2)
+    if not index.is_trained:
+        rng = np.random.default_rng(seed)
+        sample = rng.choice(count, size=min(count, train_sample), replace=False)
+        index.train(vectors[np.sort(sample)])
+    for start in range(0, count, ADD_BATCH_SIZE):
+        batch = vectors[start:start + ADD_BATCH_SIZE]
+        if ids is None:
+            index.add(batch)
+        else:
+            index.add_with_ids(batch, np.asarray(
+                ids[start:start + ADD_BATCH_SIZE], dtype=np.int64))
+    return set_search_params(index, nprobe, ef_search)
+
+
+def index_kind(index):
+    # The index type actually built: flat, ivf, ivfpq or hnsw
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexIDMap2):
+        index = faiss.downcast_index(index.index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+def needs_retrain(index_type, trained_on, count, factor=RETRAIN_FACTOR):
+    # Also when the count crosses MIN_ANN_VECTORS, where build_index switches
+    # between a flat index and a real ANN one
+    if index_type == "flat":
+        return False
+    if (trained_on < MIN_ANN_VECTORS) != (count < MIN_ANN_VECTORS):
+        return True
+    return count > trained_on * factor or count * factor < trained_on
+
+
+def remove_ids(index, ids):
+    # False when the index cannot delete in place (HNSW)
+    try:
+        index.remove_ids(np.asarray(ids, dtype=np.int64))
+    except RuntimeError:
+        return False
+    return True
+
+
+def index_vectors(index):
+    # All vectors of an exact (flat) index, in position order
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def with_ann_index(vector_store, index_type=INDEX_TYPE, **kwargs):
+    # Swaps the store's flat index for an ANN one built from the same vectors
+    if index_type == "flat":
+        return vector_store
+    vector_store.index = build_index(
+        index_vectors(vector_store.index), index_type, **kwargs)
+    return vector_store
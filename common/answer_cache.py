@@ -0,0 +1,87 @@
+# Semantic cache of RAG answers, shared by task_2 (app.py) and task_3 (task_3.py)
+import os
+import time
+import threading
+from collections import OrderedDict
+import numpy as np
+
+SIMILARITY_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+TTL_SECONDS = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+
+
+class SemanticAnswerCache:
+    """Answers keyed by knowledge-base version and question embedding.
+
+    A question hits when its cosine similarity to a cached question is at
+    least `threshold`. Entries expire after `ttl_seconds`, the least recently
+    used one is dropped past `max_entries`, and everything is cleared as soon
+    as a lookup or store comes with a different knowledge-base version.
+    """
+
+    def __init__(self, threshold=SIMILARITY_THRESHOLD, max_entries=MAX_ENTRIES,
+                 ttl_seconds=TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.kb_version = None
+        self.entries = OrderedDict()  # id -> (unit vector, answer, created)
+        self.next_id = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def check_version(self, kb_version):
+        if kb_version != self.kb_version:
+            self.entries.clear()
+            self.kb_version = kb_version
+
+    def expire(self):
+        oldest = time.time() - self.ttl_seconds
+        for entry_id in [entry_id for entry_id, (_, _, created) in self.entries.items()
+                         if created < oldest]:
+            del self.entries[entry_id]
+
+    def lookup(self, kb_version, question_vector):
+        # Returns (answer, similarity) or None
+        with self.lock:
+            self.check_version(kb_version)
+            self.expire()
+            if not self.entries:
+                self.misses += 1
+                return None
+
+            ids = list(self.entries)
+            matrix = np.stack([self.entries[entry_id][0] for entry_id in ids])
+            similarities = matrix @ unit(question_vector)
+            best = int(similarities.argmax())
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(ids[best])
+            return self.entries[ids[best]][1], float(similarities[best])
+
+    def store(self, kb_version, question_vector, answer):
+        with self.lock:
+            self.check_version(kb_version)
+            self.entries[self.next_id] = (unit(question_vector), answer, time.time())
+            self.next_id += 1
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "entries": len(self.entries),
+        }
+
+
+def unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
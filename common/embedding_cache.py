@@ -0,0 +1,159 @@
+# Disk-backed embedding cache shared by task_2 (app.py) and task_3 (task_3.py)
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from common.instrumentation import count
+from common.sqlite_cache import evict_lru
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH", os.path.join(REPO_ROOT, ".cache", "embeddings.sqlite"))
+CACHE_MAX_BYTES = int(os.getenv("EMBEDDING_CACHE_MAX_MB", "512")) * 1024 * 1024
+# Texts sent to the embedding API per request on a cache miss
+BATCH_SIZE = 100
+
+
+class CachedEmbeddings(Embeddings):
+    """Wraps an Embeddings model with a SQLite cache of float32 vectors.
+
+    Entries are keyed by model name, query/document kind and a SHA-256 of the
+    text. Misses go to the wrapped model in batches; once the cache is over
+    max_bytes the least recently used vectors are evicted.
+    """
+
+    def __init__(self, embeddings, model_name, path=CACHE_PATH,
+                 max_bytes=CACHE_MAX_BYTES, batch_size=BATCH_SIZE):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.batch_size = batch_size
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+        CREATE TABLE IF NOT EXISTS embeddings (
+            key TEXT PRIMARY KEY, vector BLOB, last_used REAL);
+        CREATE INDEX IF NOT EXISTS idx_embeddings_last_used
+            ON embeddings (last_used);
+        """)
+
+    def cache_key(self, text, kind):
+        return hashlib.sha256(
+            f"{self.model_name}\n{kind}\n{text}".encode("utf-8")).hexdigest()
+
+    def lookup(self, keys):
+        found = {}
+        keys = list(keys)
+        with self.lock:
+            # SQLite limits bound parameters, so look keys up in slices
+            for i in range(0, len(keys), 500):
+                batch = keys[i:i + 500]
+                rows = self.conn.execute(
+                    "SELECT key, vector FROM embeddings WHERE key IN "
+                    f"({','.join('?' * len(batch))})", batch).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32)
+            now = time.time()
+            self.conn.executemany(
+                "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                [(now, key) for key in found])
+            self.conn.commit()
+        return found
+
+    def store(self, vectors):
+        now = time.time()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                 for key, vector in vectors.items()])
+            self.conn.commit()
+
+    def evict(self):
+        with self.lock:
+            evict_lru(self.conn, "embeddings", "LENGTH(vector)", self.max_bytes)
+
+    def miss_batches(self, texts):
+        # Wrapped models that schedule their own batches (EmbeddingScheduler)
+        # get every miss at once; anything else is called one batch at a time
+        if hasattr(self.embeddings, "iter_embeddings"):
+            yield from self.embeddings.iter_embeddings(texts)
+            return
+        for i in range(0, len(texts), self.batch_size):
+            batch = texts[i:i + self.batch_size]
+            yield list(range(i, i + len(batch))), self.embeddings.embed_documents(batch)
+
+    def iter_embeddings(self, texts):
+        # Yields (positions, vectors): all cache hits first, then each batch
+        # of misses as soon as it comes back from the model
+        keys = [self.cache_key(text, "document") for text in texts]
+        found = self.lookup(set(keys))
+
+        positions_by_key = {}
+        for position, key in enumerate(keys):
+            positions_by_key.setdefault(key, []).append(position)
+        hits = [position for position, key in enumerate(keys) if key in found]
+        count("embedding.cache_hits", len(hits))
+        count("embedding.cache_misses", len(texts) - len(hits))
+        if hits:
+            yield hits, [found[keys[position]].tolist() for position in hits]
+
+        missing_keys = [key for key in positions_by_key if key not in found]
+        missing_texts = [texts[positions_by_key[key][0]] for key in missing_keys]
+        for batch, vectors in self.miss_batches(missing_texts):
+            vectors = [np.asarray(vector, dtype=np.float32) for vector in vectors]
+            batch_keys = [missing_keys[i] for i in batch]
+            self.store(dict(zip(batch_keys, vectors)))
+            positions, batch_vectors = [], []
+            for key, vector in zip(batch_keys, vectors):
+                for position in positions_by_key[key]:
+                    positions.append(position)
+                    batch_vectors.append(vector.tolist())
+            yield positions, batch_vectors
+        if missing_keys:
+            self.evict()
+
+    def embed_documents(self, texts):
+        vectors = [None] * len(texts)
+        for positions, batch in self.iter_embeddings(texts):
+            for position, vector in zip(positions, batch):
+                vectors[position] = vector
+        return vectors
+
+    def embed_queries(self, texts):
+        # Batch counterpart of embed_query, used by task_3's batch mode
+        keys = [self.cache_key(text, "query") for text in texts]
+        found = self.lookup(set(keys))
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in found:
+                missing[key] = text
+        if missing:
+            if hasattr(self.embeddings, "embed_queries"):
+                vectors = self.embeddings.embed_queries(list(missing.values()))
+            else:
+                vectors = [self.embeddings.embed_query(text) for text in missing.values()]
+            new = {key: np.asarray(vector, dtype=np.float32)
+                   for key, vector in zip(missing, vectors)}
+            self.store(new)
+            found.update(new)
+            self.evict()
+        return [found[key].tolist() for key in keys]
+
+    def embed_query(self, text):
+        key = self.cache_key(text, "query")
+        found = self.lookup([key])
+        if key in found:
+            count("embedding.cache_hits")
+            return found[key].tolist()
+        count("embedding.cache_misses")
+        vector = np.asarray(self.embeddings.embed_query(text), dtype=np.float32)
+        self.store({key: vector})
+        self.evict()
+        return vector.tolist()
@@ -0,0 +1,119 @@
+# Concurrent, rate-limited embedding of large chunk lists
+import os
+import time
+import inspect
+import random
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from langchain_core.embeddings import Embeddings
+from langchain_community.vectorstores import FAISS
+
+from common.instrumentation import span, count
+from common.rate_limit import TokenBucket
+
+# Texts per embedding request, requests in flight and the provider quota
+BATCH_SIZE = 100
+MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "4"))
+REQUESTS_PER_MINUTE = int(os.getenv("EMBEDDING_REQUESTS_PER_MINUTE", "1500"))
+MAX_RETRIES = 5
+
+
+class EmbeddingScheduler(Embeddings):
+    """Splits texts into batches and embeds them concurrently.
+
+    At most max_concurrency requests are in flight, a token bucket keeps the
+    request rate under requests_per_minute, and failed requests (e.g. quota
+    errors) are retried with exponential backoff. iter_embeddings yields each
+    batch as soon as it is done.
+    """
+
+    def __init__(self, embeddings, batch_size=BATCH_SIZE,
+                 max_concurrency=MAX_CONCURRENCY,
+                 requests_per_minute=REQUESTS_PER_MINUTE,
+                 max_retries=MAX_RETRIES, backoff_seconds=1.0):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.bucket = TokenBucket(
+            requests_per_minute / 60, capacity=max(1, max_concurrency))
+
+    def with_retries(self, call, *args):
+        for attempt in range(self.max_retries + 1):
+            self.bucket.acquire()
+            try:
+                with span("embedding.request", attempt=attempt):
+                    return call(*args)
+            except Exception:
+                count("embedding.errors")
+                if attempt == self.max_retries:
+                    raise
+                delay = self.backoff_seconds * 2 ** attempt
+                time.sleep(delay + random.uniform(0, delay / 2))
+
+    def iter_embeddings(self, texts, embed_batch=None):
+        # Yields (positions, vectors) per finished batch, in completion order
+        embed_batch = embed_batch or self.embeddings.embed_documents
+        batches = [list(range(i, min(i + self.batch_size, len(texts))))
+                   for i in range(0, len(texts), self.batch_size)]
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = {
+                pool.submit(self.with_retries, embed_batch,
+                            [texts[i] for i in positions]): positions
+                for positions in batches}
+            for future in as_completed(futures):
+                yield futures[future], future.result()
+
+    def embed_documents(self, texts):
+        return collect(self.iter_embeddings(texts), len(texts))
+
+    def embed_query(self, text):
+        return self.with_retries(self.embeddings.embed_query, text)
+
+    def embed_query_batch(self, texts):
+        # Models with a task_type (Google) embed a batch of queries in one
+        # request; anything else gets one embed_query call per text
+        parameters = inspect.signature(self.embeddings.embed_documents).parameters
+        if "task_type" in parameters:
+            return self.embeddings.embed_documents(texts, task_type="retrieval_query")
+        return [self.embeddings.embed_query(text) for text in texts]
+
+    def embed_queries(self, texts):
+        return collect(
+            self.iter_embeddings(texts, self.embed_query_batch), len(texts))
+
+
+def collect(batches, count):
+    vectors = [None] * count
+    for positions, batch in batches:
+        for position, vector in zip(positions, batch):
+            vectors[position] = vector
+    return vectors
+
+
+def iter_embeddings(embeddings, texts):
+    if hasattr(embeddings, "iter_embeddings"):
+        return embeddings.iter_embeddings(texts)
+    return iter([(list(range(len(texts))), embeddings.embed_documents(texts))])
+
+
+def index_documents(documents, embeddings, vector_store=None, ids=None,
+                    on_progress=None):
+    # Adds batches to the FAISS index as they finish embedding instead of
+    # waiting for the whole upload; on_progress(done, total) after each one
+    texts = [doc.page_content for doc in documents]
+    done = 0
+    for positions, vectors in iter_embeddings(embeddings, texts):
+        text_embeddings = [(texts[i], vector) for i, vector in zip(positions, vectors)]
+        metadatas = [documents[i].metadata for i in positions]
+        batch_ids = [ids[i] for i in positions] if ids else None
+        if vector_store is None:
+            vector_store = FAISS.from_embeddings(
+                text_embeddings, embeddings, metadatas=metadatas, ids=batch_ids)
+        else:
+            vector_store.add_embeddings(
+                text_embeddings, metadatas=metadatas, ids=batch_ids)
+        done += len(positions)
+        if on_progress is not None:
+            on_progress(done, len(texts))
+    return vector_store
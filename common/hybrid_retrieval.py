@@ -0,0 +1,130 @@
+# Local BM25 index and hybrid (BM25 + FAISS) retrieval for task_2 and task_3
+import re
+import math
+from collections import Counter, defaultdict
+from typing import Any
+import numpy as np
+from langchain_core.retrievers import BaseRetriever
+
+from common.instrumentation import span, traced
+
+# Keeps identifiers such as policy numbers ("AB-1234/5") as single tokens
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_/.][a-z0-9]+)*")
+# Reciprocal rank fusion constant
+RRF_K = 60
+# Queries up to this many tokens can be keyword lookups
+MAX_KEYWORD_TOKENS = 3
+# Identifiers such as policy or claim numbers ("AB-1234", "POL778")
+ID_PATTERN = re.compile(r"\b[A-Z]{2,}-?\d+")
+# Short queries starting with one of these are questions, not keyword lookups
+QUESTION_WORDS = {"what", "who", "why", "how", "when", "where", "which",
+                  "is", "are", "does", "do", "can", "explain", "describe"}
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    """Inverted index over chunk texts, scored with Okapi BM25.
+
+    Postings are numpy arrays of (chunk position, term frequency), so a query
+    is scored by a few vectorised updates per query term.
+    """
+
+    def __init__(self, ids, texts, k1=1.5, b=0.75):
+        self.ids = list(ids)
+        self.k1 = k1
+        self.b = b
+
+        postings = defaultdict(lambda: ([], []))
+        lengths = []
+        for position, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            lengths.append(sum(counts.values()))
+            for token, frequency in counts.items():
+                postings[token][0].append(position)
+                postings[token][1].append(frequency)
+        self.postings = {
+            token: (np.array(positions, dtype=np.int64),
+                    np.array(frequencies, dtype=np.float32))
+            for token, (positions, frequencies) in postings.items()}
+        self.lengths = np.array(lengths, dtype=np.float32)
+        self.avg_length = float(self.lengths.mean()) if lengths else 1.0
+
+    @traced("bm25.search")
+    def search(self, query, k=4):
+        # Returns [(id, score)] best first, only chunks sharing a query term
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        count = len(self.ids)
+        for token in set(tokenize(query)):
+            if token not in self.postings:
+                continue
+            positions, frequencies = self.postings[token]
+            idf = math.log(1 + (count - len(positions) + 0.5) / (len(positions) + 0.5))
+            norm = frequencies + self.k1 * (
+                1 - self.b + self.b * self.lengths[positions] / self.avg_length)
+            scores[positions] += idf * frequencies * (self.k1 + 1) / norm
+
+        matched = np.flatnonzero(scores)
+        best = matched[np.argsort(-scores[matched], kind="stable")[:k]]
+        return [(self.ids[i], float(scores[i])) for i in best]
+
+
+def build_bm25_index(vector_store):
+    # Indexes exactly the chunks in the FAISS store, under their docstore ids
+    ids = list(vector_store.index_to_docstore_id.values())
+    texts = [vector_store.docstore.search(doc_id).page_content for doc_id in ids]
+    return BM25Index(ids, texts)
+
+
+def is_keyword_query(query):
+    # Identifiers, and short non-questions, quoted phrases or numbers, are
+    # answered lexically without calling the embedding API. Longer questions
+    # are fused with the dense ranking even if they mention a year
+    tokens = tokenize(query)
+    if not tokens:
+        return False
+    if ID_PATTERN.search(query):
+        return True
+    return len(tokens) <= MAX_KEYWORD_TOKENS and (
+        '"' in query or any(c.isdigit() for c in query)
+        or tokens[0] not in QUESTION_WORDS)
+
+
+def dense_search_ids(vector_store, query_vectors, k):
+    # One FAISS call for any number of queries; returns docstore ids per query
+    with span("faiss.search", queries=len(query_vectors), k=k):
+        _, indices = vector_store.index.search(
+            np.asarray(query_vectors, dtype=np.float32), k)
+    return [[vector_store.index_to_docstore_id[i] for i in row if i != -1]
+            for row in indices]
+
+
+def fuse_rankings(rankings, k):
+    # Reciprocal rank fusion of several best-first id lists
+    scores = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking):
+            scores[doc_id] += 1.0 / (RRF_K + rank + 1)
+    return sorted(scores, key=scores.get, reverse=True)[:k]
+
+
+class HybridRetriever(BaseRetriever):
+    """Fuses BM25 and FAISS rankings; keyword queries skip the dense search."""
+
+    vector_store: Any
+    lexical_index: Any
+    k: int = 4
+    fetch_k: int = 20
+
+    def _get_relevant_documents(self, query, *, run_manager=None):
+        lexical = [doc_id for doc_id, _ in self.lexical_index.search(query, self.fetch_k)]
+        if lexical and is_keyword_query(query):
+            ids = lexical[:self.k]
+        else:
+            with span("embedding.query"):
+                query_vector = self.vector_store.embedding_function.embed_query(query)
+            dense = dense_search_ids(self.vector_store, [query_vector], self.fetch_k)[0]
+            ids = fuse_rankings([dense, lexical], self.k)
+        return [self.vector_store.docstore.search(doc_id) for doc_id in ids]
@@ -0,0 +1,231 @@
+# Spans and counters for the hot paths of every task, exported as JSONL or a
+# Chrome trace (chrome://tracing, Perfetto)
+import os
+import json
+import time
+import atexit
+import threading
+import contextvars
+import multiprocessing
+from collections import deque, defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+# Spans finished while a request_trace() is active are also added to it
+CURRENT_REQUEST = contextvars.ContextVar("current_request", default=None)
+
+
+def trace_path():
+    # TRACE_PATH: where spans are written when the process exits; ".json"
+    # gives a Chrome trace, anything else JSONL. Read on use, so a .env
+    # loaded after this module is imported still applies
+    return os.getenv("TRACE_PATH")
+
+
+def tracing():
+    # Worker processes hand their spans back to the parent (see Tracer.add)
+    # rather than keeping or writing them themselves
+    return bool(trace_path()) and multiprocessing.parent_process() is None
+
+
+class Tracer:
+    """Keeps the latest spans while tracing is on, and running totals of counters.
+
+    Spans are only stored when TRACE_PATH is set (up to TRACE_MAX_EVENTS);
+    a request_trace() collects its own spans either way.
+    """
+
+    def __init__(self, max_events=None):
+        self.max_events = max_events
+        # Created with the first stored span, once TRACE_MAX_EVENTS can be read
+        self.events = None
+        self.counters = defaultdict(float)
+        # Timestamps are wall-clock microseconds, so spans recorded in other
+        # processes line up on the same timeline
+        self.offset_ns = time.time_ns() - time.perf_counter_ns()
+        self.lock = threading.Lock()
+
+    def record(self, name, start_ns, end_ns, attrs):
+        event = {
+            "name": name,
+            "start_us": (start_ns + self.offset_ns) / 1000,
+            "duration_ms": (end_ns - start_ns) / 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "attrs": attrs,
+        }
+        self.add([event])
+
+    def add(self, events):
+        # Also takes spans recorded elsewhere, e.g. returned by a worker process
+        if tracing():
+            with self.lock:
+                if self.events is None:
+                    self.events = deque(maxlen=self.max_events or int(
+                        os.getenv("TRACE_MAX_EVENTS", "200000")))
+                self.events.extend(events)
+        request = CURRENT_REQUEST.get()
+        if request is not None:
+            request.extend(events)
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] += value
+
+    def export_jsonl(self, path):
+        with self.lock:
+            events, counters = list(self.events or ()), dict(self.counters)
+        with open(path, "w", encoding="utf-8") as f:
+            for event in events:
+                f.write(json.dumps({"type": "span", **event}, default=str) + "\n")
+            for name, value in counters.items():
+                f.write(json.dumps({"type": "counter", "name": name, "value": value}) + "\n")
+
+    def export_chrome_trace(self, path):
+        with self.lock:
+            events, counters = list(self.events or ()), dict(self.counters)
+        trace = [{"name": event["name"], "ph": "X", "ts": event["start_us"],
+                  "dur": event["duration_ms"] * 1000, "pid": event["pid"],
+                  "tid": event["tid"], "args": event["attrs"]}
+                 for event in events]
+        end_us = max((event["ts"] + event["dur"] for event in trace), default=0)
+        trace += [{"name": name, "ph": "C", "ts": end_us, "pid": os.getpid(),
+                   "args": {"value": value}}
+                  for name, value in counters.items()]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace}, f, default=str)
+
+    def export(self, path):
+        if path.endswith(".json"):
+            self.export_chrome_trace(path)
+        else:
+            self.export_jsonl(path)
+
+
+TRACER = Tracer()
+
+
+def export_on_exit():
+    if tracing():
+        TRACER.export(trace_path())
+
+
+atexit.register(export_on_exit)
+
+
+@contextmanager
+def span(name, **attrs):
+    # attrs can be filled in inside the block, e.g. result sizes
+    start = time.perf_counter_ns()
+    try:
+        yield attrs
+    finally:
+        TRACER.record(name, start, time.perf_counter_ns(), attrs)
+
+
+def traced(name):
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(name, value=1):
+    TRACER.count(name, value)
+
+
+@contextmanager
+def request_trace():
+    # Collects the spans of one request (e.g. one chat question); worker
+    # threads join in when run with contextvars.copy_context().run
+    events = []
+    token = CURRENT_REQUEST.set(events)
+    try:
+        yield events
+    finally:
+        CURRENT_REQUEST.reset(token)
+
+
+def breakdown(events):
+    # Per span name: calls, total milliseconds and tokens, slowest first
+    rows = defaultdict(lambda: {"calls": 0, "total_ms": 0.0, "tokens": 0})
+    for event in events:
+        row = rows[event["name"]]
+        row["calls"] += 1
+        row["total_ms"] += event["duration_ms"]
+        row["tokens"] += event["attrs"].get("prompt_tokens", 0) + \
+            event["attrs"].get("completion_tokens", 0)
+    return sorted(({"span": name, **row} for name, row in rows.items()),
+                  key=lambda row: -row["total_ms"])
+
+
+def token_usage(response):
+    # (prompt, completion) tokens from llm_output, or from the message's
+    # usage metadata when streaming
+    usage = (response.llm_output or {}).get("token_usage") or {}
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+    return 0, 0
+
+
+class TraceCallbackHandler(BaseCallbackHandler):
+    """Turns LangChain LLM and tool callbacks into spans and token counters."""
+
+    def __init__(self):
+        self.started = {}
+
+    def start(self, run_id, name):
+        self.started[run_id] = (name, time.perf_counter_ns(), CURRENT_REQUEST.get())
+
+    def finish(self, run_id, **attrs):
+        if run_id not in self.started:
+            return
+        name, start, request = self.started.pop(run_id)
+        # Callbacks can arrive on another thread; keep the caller's request
+        token = CURRENT_REQUEST.set(request)
+        try:
+            TRACER.record(name, start, time.perf_counter_ns(), attrs)
+        finally:
+            CURRENT_REQUEST.reset(token)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self.start(run_id, "llm")
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self.start(run_id, "llm")
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        prompt_tokens, completion_tokens = token_usage(response)
+        count("llm.calls")
+        count("llm.prompt_tokens", prompt_tokens)
+        count("llm.completion_tokens", completion_tokens)
+        self.finish(run_id, prompt_tokens=prompt_tokens,
+                    completion_tokens=completion_tokens)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        count("llm.errors")
+        self.finish(run_id, error=str(error))
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self.start(run_id, f"tool.{(serialized or {}).get('name', 'unknown')}")
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        count("tool.calls")
+        self.finish(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        count("tool.errors")
+        self.finish(run_id, error=str(error))
+
+
+TRACE_CALLBACKS = [TraceCallbackHandler()]
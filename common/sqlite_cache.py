@@ -0,0 +1,29 @@
+# Size-capped LRU eviction shared by the SQLite caches (embeddings, task_5's
+# HTTP responses)
+
+# A cache over its cap is trimmed to this fraction of it, so eviction doesn't
+# run again on the next store
+TRIM_TO = 0.9
+
+
+def evict_lru(conn, table, size_column, max_bytes, trim_to=TRIM_TO, total=None):
+    # table needs key and last_used columns; size_column is a column or
+    # expression giving each row's size. A caller that keeps a running size
+    # passes it as total, which saves summing the whole table. The caller
+    # holds the connection's lock. Returns the bytes freed
+    if total is None:
+        total = conn.execute(
+            f"SELECT COALESCE(SUM({size_column}), 0) FROM {table}").fetchone()[0]
+    if total <= max_bytes:
+        return 0
+    excess = total - int(max_bytes * trim_to)
+    stale, freed = [], 0
+    for key, size in conn.execute(
+            f"SELECT key, {size_column} FROM {table} ORDER BY last_used"):
+        stale.append((key,))
+        freed += size
+        if freed >= excess:
+            break
+    conn.executemany(f"DELETE FROM {table} WHERE key = ?", stale)
+    conn.commit()
+    return freed
@@ -0,0 +1,68 @@
+import os
+import time
+import argparse
+import fitz  # PyMuPDF
+
+from task_1 import INPUT_DIR, extract_key_values
+
+# Compares plain text extraction with text + layout key-value extraction on a
+# large document built by repeating the bundled PDFs. MuPDF caches fonts and
+# page resources, so an untimed warm-up pass comes first and each timing is
+# the best of several runs, taken in turn.
+
+
+def build_large_document(repeat):
+    large = fitz.open()
+    pdf_files = sorted(f for f in os.listdir(INPUT_DIR)
+                       if f.lower().endswith(".pdf"))
+    for _ in range(repeat):
+        for pdf_file in pdf_files:
+            with fitz.open(os.path.join(INPUT_DIR, pdf_file)) as doc:
+                large.insert_pdf(doc)
+    return large
+
+
+def time_plain_text(doc):
+    start = time.perf_counter()
+    for page in doc:
+        page.get_text()
+    return time.perf_counter() - start
+
+
+def time_text_and_key_values(doc):
+    start = time.perf_counter()
+    pairs = 0
+    for page in doc:
+        textpage = page.get_textpage()
+        page.get_text(textpage=textpage)
+        pairs += len(extract_key_values(page, textpage))
+    return time.perf_counter() - start, pairs
+
+
+def run_benchmark(repeat, runs):
+    doc = build_large_document(repeat)
+    pages = doc.page_count
+
+    time_text_and_key_values(doc)
+    plain_seconds = layout_seconds = float("inf")
+    for _ in range(runs):
+        plain_seconds = min(plain_seconds, time_plain_text(doc))
+        seconds, pairs = time_text_and_key_values(doc)
+        layout_seconds = min(layout_seconds, seconds)
+
+    print(f"Pages: {pages}")
+    print(f"{'Plain text:':26}{pages / plain_seconds:8.1f} pages/s")
+    print(f"{'Text + layout key-values:':26}{pages / layout_seconds:8.1f} pages/s "
+          f"({pairs} pairs)")
+    print(f"Relative cost: {layout_seconds / plain_seconds:.2f}x plain text")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the layout key-value engine against plain text extraction")
+    parser.add_argument("--repeat", type=int, default=100,
+                        help="copies of the bundled PDFs in the test document")
+    parser.add_argument("--runs", type=int, default=5,
+                        help="timed runs of each; the best is reported")
+    args = parser.parse_args()
+    run_benchmark(args.repeat, args.runs)
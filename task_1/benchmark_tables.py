@@ -0,0 +1,117 @@
+import os
+import time
+import argparse
+from contextlib import nullcontext
+import fitz  # PyMuPDF
+import pdfplumber
+
+from task_1 import INPUT_DIR, TABLE_ENGINES, extract_tables, may_have_tables
+
+# Compares the two table engines on the bundled PDFs (plus any PDFs given on
+# the command line): speed with and without the ruling-line pre-check, and
+# how closely PyMuPDF's tables and cells match pdfplumber's.
+
+# Tables from the two engines whose boxes overlap this much are the same table
+MATCH_IOU = 0.5
+# Each timing is the best of this many runs, taken in turn across the
+# configurations so that machine load affects them all alike
+REPEATS = 3
+
+
+def time_engine(paths, table_engine, precheck):
+    start = time.perf_counter()
+    tables = 0
+    for path in paths:
+        plumber = pdfplumber.open(path) if table_engine == "pdfplumber" else nullcontext()
+        with fitz.open(path) as doc, plumber as plumber_pdf:
+            for page in doc:
+                tables += len(extract_tables(page, plumber_pdf, table_engine, precheck))
+    return time.perf_counter() - start, tables
+
+
+def count_pages(paths):
+    # (pages, pages the pre-check skips, tables PyMuPDF finds on those pages)
+    pages = skipped = missed = 0
+    for path in paths:
+        with fitz.open(path) as doc:
+            for page in doc:
+                pages += 1
+                drawings = page.get_drawings()
+                if not may_have_tables(page, drawings):
+                    skipped += 1
+                    missed += len(page.find_tables(paths=drawings).tables)
+    return pages, skipped, missed
+
+
+def overlap(a, b):
+    # Intersection over union of two (x0, y0, x1, y1) boxes
+    width = min(a[2], b[2]) - max(a[0], b[0])
+    height = min(a[3], b[3]) - max(a[1], b[1])
+    if width <= 0 or height <= 0:
+        return 0.0
+    area = lambda box: (box[2] - box[0]) * (box[3] - box[1])
+    return width * height / (area(a) + area(b) - width * height)
+
+
+def normalize(cell):
+    return " ".join(str(cell or "").split())
+
+
+def compare_cells(paths):
+    # pdfplumber is the reference: each of its tables is matched to the
+    # PyMuPDF table covering the same area, then compared cell by cell
+    counts = {"reference": 0, "found": 0, "matched": 0, "cells": 0, "same": 0}
+    for path in paths:
+        with fitz.open(path) as doc, pdfplumber.open(path) as pdf:
+            for page, plumber_page in zip(doc, pdf.pages):
+                found = [(table.bbox, table.extract())
+                         for table in page.find_tables().tables]
+                counts["found"] += len(found)
+                for table in plumber_page.find_tables():
+                    rows = table.extract()
+                    counts["reference"] += 1
+                    counts["cells"] += sum(len(row) for row in rows)
+                    best = max(found, key=lambda f: overlap(f[0], table.bbox), default=None)
+                    if best is None or overlap(best[0], table.bbox) < MATCH_IOU:
+                        continue
+                    counts["matched"] += 1
+                    other = best[1]
+                    counts["same"] += sum(
+                        1 for r, row in enumerate(rows) for c, cell in enumerate(row)
+                        if r < len(other) and c < len(other[r])
+                        and normalize(other[r][c]) == normalize(cell))
+                plumber_page.close()
+    return counts
+
+
+def run_benchmark(paths):
+    pages, skipped, missed = count_pages(paths)
+    print(f"Pages: {pages} ({skipped} skipped by the pre-check, "
+          f"{missed} tables found on them without it)")
+    configs = [(table_engine, precheck)
+               for table_engine in TABLE_ENGINES for precheck in (False, True)]
+    best = {config: (float("inf"), 0) for config in configs}
+    for _ in range(REPEATS):
+        for config in configs:
+            best[config] = min(best[config], time_engine(paths, *config))
+    for (table_engine, precheck), (seconds, tables) in best.items():
+        label = f"{table_engine}{' + pre-check' if precheck else ''}:"
+        print(f"{label:26}{pages / seconds:8.1f} pages/s ({tables} tables)")
+
+    counts = compare_cells(paths)
+    print(f"pdfplumber tables: {counts['reference']}, PyMuPDF tables: {counts['found']}, "
+          f"matched: {counts['matched']}")
+    if counts["cells"]:
+        print(f"Cell agreement: {counts['same'] / counts['cells']:.1%} of "
+              f"{counts['cells']} pdfplumber cells have the same text in PyMuPDF")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark the PyMuPDF table engine against pdfplumber")
+    parser.add_argument("extra", nargs="*",
+                        help="more PDFs to include, e.g. text-heavy ones")
+    args = parser.parse_args()
+    bundled = sorted(os.path.join(INPUT_DIR, f) for f in os.listdir(INPUT_DIR)
+                     if f.lower().endswith(".pdf"))
+    run_benchmark(bundled + args.extra)
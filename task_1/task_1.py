@@ -1,83 +1,705 @@
-import os
-import json
-import pandas as pd
-import pdfplumber
-import fitz  # PyMuPDF
-
-# Paths
-INPUT_DIR = "pdfs"
-OUTPUT_DIR = "output"
-TABLE_DIR = os.path.join(OUTPUT_DIR, "tables")
-KV_DIR = os.path.join(OUTPUT_DIR, "key_values")
-TEXT_DIR = os.path.join(OUTPUT_DIR, "text")
-
-# Create output directories
-os.makedirs(TABLE_DIR, exist_ok=True)
-os.makedirs(KV_DIR, exist_ok=True)
-os.makedirs(TEXT_DIR, exist_ok=True)
-
-
-def extract_key_values_and_text(pdf_path):
-    doc = fitz.open(pdf_path)
-    key_values = {}
-    full_text = ""
-    for page in doc:
-        text = page.get_text()
-        full_text += text + "\n"
-        lines = text.split("\n")
-        for line in lines:
-            if ":" in line:
-                parts = line.split(":", 1)
-                key = parts[0].strip()
-                value = parts[1].strip()
-                if key and value:
-                    key_values[key] = value
-    return key_values, full_text
-
-
-def extract_tables(pdf_path):
-    tables = []
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            extracted_tables = page.extract_tables()
-            for table in extracted_tables:
-                df = pd.DataFrame(table[1:], columns=table[0])
-                tables.append(df)
-    return tables
-
-
-def save_output(pdf_name, key_values, tables, full_text):
-    base_name = os.path.splitext(pdf_name)[0]
-
-    # Save key-values as JSON
-    with open(os.path.join(KV_DIR, f"{base_name}_key_values.json"), "w", encoding="utf-8") as f:
-        json.dump(key_values, f, indent=4)
-
-    # Save extracted text as .txt
-    with open(os.path.join(TEXT_DIR, f"{base_name}_text.txt"), "w", encoding="utf-8") as f:
-        f.write(full_text)
-
-    # Save each table to CSV
-    for i, table_df in enumerate(tables):
-        csv_path = os.path.join(TABLE_DIR, f"{base_name}_table_{i+1}.csv")
-        table_df.to_csv(csv_path, index=False)
-
-
-def process_all_pdfs():
-    pdf_files = [f for f in os.listdir(
-        INPUT_DIR) if f.lower().endswith(".pdf")]
-
-    for pdf_file in pdf_files:
-        pdf_path = os.path.join(INPUT_DIR, pdf_file)
-        print(f"Processing: {pdf_file}")
-
-        key_values, full_text = extract_key_values_and_text(pdf_path)
-        tables = extract_tables(pdf_path)
-
-        save_output(pdf_file, key_values, tables, full_text)
-
-        print(f"Finished: {pdf_file}\n")
-
-
-if __name__ == "__main__":
-    process_all_pdfs()
+import os
+import sys
+import json
+import hashlib
+import sqlite3
+import argparse
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+import pandas as pd
+import pdfplumber
+import fitz  # PyMuPDF
+from dotenv import load_dotenv
+
+# TRACE_PATH and other settings can come from .env, as in the other tasks
+load_dotenv()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.instrumentation import TRACER, request_trace, span
+
+# Paths
+INPUT_DIR = "pdfs"
+OUTPUT_DIR = "output"
+TABLE_DIR = os.path.join(OUTPUT_DIR, "tables")
+KV_DIR = os.path.join(OUTPUT_DIR, "key_values")
+TEXT_DIR = os.path.join(OUTPUT_DIR, "text")
+MANIFEST_PATH = os.path.join(OUTPUT_DIR, "manifest.json")
+
+# Create output directories
+os.makedirs(TABLE_DIR, exist_ok=True)
+os.makedirs(KV_DIR, exist_ok=True)
+os.makedirs(TEXT_DIR, exist_ok=True)
+
+# Batch mode: large files are split into page ranges of this size
+PAGES_PER_TASK = 50
+
+# Bump whenever the extracted output changes, so cached PDFs are redone
+EXTRACTOR_VERSION = 4
+
+# Table engines: PyMuPDF's finder on the already-open document, or the
+# original pdfplumber one (opens the file a second time, slower)
+TABLE_ENGINES = ("pymupdf", "pdfplumber")
+TABLE_ENGINE = "pymupdf"
+# Both find tables from ruling lines: lines, and rectangles no thicker than
+# MAX_RULING_WIDTH (wider ones are boxes or shaded backgrounds). A page needs
+# at least MIN_RULINGS horizontal and vertical rulings that cross each other
+MIN_RULINGS = 2
+MAX_RULING_WIDTH = 3.0
+# Lines within this many points of horizontal/vertical count as rulings, and
+# rulings this close count as crossing
+RULING_TOLERANCE = 1.0
+RULING_SNAP = 3.0
+# Pages without a grid are still searched when their text lines up in
+# columns: MIN_TEXT_COLUMNS cell starts shared by MIN_TEXT_ROWS rows, where
+# words more than COLUMN_GAP apart on a line are separate cells
+MIN_TEXT_COLUMNS = 3
+MIN_TEXT_ROWS = 3
+COLUMN_GAP = 10.0
+ROW_TOLERANCE = 2.0
+
+# Layout key-value engine: a label is at most this many words ending in ':'
+MAX_LABEL_WORDS = 4
+# and a value below it must start within this many label heights
+MAX_BELOW_GAP = 1.5
+
+
+def split_glued_labels(boxes, texts, line_ids):
+    # "WPN:24791" becomes "WPN:" and "24791"; URLs ("https://") and times
+    # ("10:30") are left alone
+    colon_at = np.char.find(texts, ":")
+    glued = np.flatnonzero((colon_at > 0) & (colon_at < np.char.str_len(texts) - 1))
+    split = np.array([i for i in glued
+                      if any(c.isalpha() for c in texts[i][:colon_at[i]])
+                      and texts[i][colon_at[i] + 1] != "/"], dtype=int)
+    if split.size == 0:
+        return boxes, texts, line_ids
+
+    heads = [texts[i][:colon_at[i] + 1] for i in split]
+    tails = [texts[i][colon_at[i] + 1:] for i in split]
+    share = (colon_at[split] + 1) / np.char.str_len(texts[split])
+    middle = boxes[split, 0] + (boxes[split, 2] - boxes[split, 0]) * share
+    tail_boxes = boxes[split].copy()
+    tail_boxes[:, 0] = middle
+    boxes[split, 2] = middle
+    texts[split] = heads
+    return (np.insert(boxes, split + 1, tail_boxes, axis=0),
+            np.insert(texts, split + 1, tails),
+            np.insert(line_ids, split + 1, line_ids[split]))
+
+
+def extract_key_values(page, textpage=None):
+    # Works on the page's word boxes as arrays: labels are short runs of words
+    # ending in ':', paired with a value on the same line, else the nearest
+    # line in the next column, else the line just below. Every occurrence is
+    # kept with its page and position.
+    words = page.get_text("words", textpage=textpage)
+    if not words:
+        return []
+
+    rows = np.array(words, dtype=object)
+    boxes = rows[:, :4].astype(float)
+    texts = rows[:, 4].astype(str)
+    line_ids = rows[:, 5].astype(np.int64) * 100000 + rows[:, 6].astype(np.int64)
+    boxes, texts, line_ids = split_glued_labels(boxes, texts, line_ids)
+    n = len(texts)
+    index = np.arange(n)
+
+    # Lines as (start, end) word ranges with their bounding boxes
+    line_start_mask = np.r_[True, line_ids[1:] != line_ids[:-1]]
+    line_of_word = np.cumsum(line_start_mask) - 1
+    line_starts = np.flatnonzero(line_start_mask)
+    line_ends = np.r_[line_starts[1:], n]
+    line_boxes = np.column_stack([
+        np.minimum.reduceat(boxes[:, 0], line_starts),
+        np.minimum.reduceat(boxes[:, 1], line_starts),
+        np.maximum.reduceat(boxes[:, 2], line_starts),
+        np.maximum.reduceat(boxes[:, 3], line_starts),
+    ])
+
+    # A label starts a line or follows a word closing a clause, which keeps
+    # caption text like "trends, 1980 to 2010. Source:" out of the keys
+    ends_colon = np.char.endswith(texts, ":")
+    ends_clause = ends_colon | np.char.endswith(texts, ".") | \
+        np.char.endswith(texts, ",") | np.char.endswith(texts, ";")
+    label_start_mask = line_start_mask | np.r_[True, ends_clause[:-1]]
+    word_label_start = np.maximum.accumulate(
+        np.where(label_start_mask, index, 0))
+    labels = np.flatnonzero(
+        ends_colon & (index - word_label_start < MAX_LABEL_WORDS))
+    if labels.size == 0:
+        return []
+    label_starts = word_label_start[labels]
+    label_lines = line_of_word[labels]
+    label_boxes = np.column_stack([
+        boxes[label_starts, 0],
+        np.minimum(boxes[label_starts, 1], boxes[labels, 1]),
+        boxes[labels, 2],
+        np.maximum(boxes[label_starts, 3], boxes[labels, 3]),
+    ])
+
+    # Same line: the words after the label up to the next label or line end
+    next_label_starts = np.r_[label_starts[1:], n]
+    inline_ends = np.minimum(line_ends[label_lines], next_label_starts)
+    has_inline = inline_ends > labels + 1
+
+    # Other lines only count as values up to their first label, and not at
+    # all when they start with one
+    line_value_ends = line_ends.copy()
+    np.minimum.at(line_value_ends, label_lines, label_starts)
+    value_lines = line_value_ends > line_starts
+
+    # Next column / below, for all remaining labels against all lines at once
+    lb = label_boxes[:, None, :]
+    lines = line_boxes[None, :, :]
+    centre_y = (lb[..., 1] + lb[..., 3]) / 2
+    height = lb[..., 3] - lb[..., 1]
+    right = value_lines & (lines[..., 0] >= lb[..., 2]) & \
+        (lines[..., 1] <= centre_y) & (lines[..., 3] >= centre_y)
+    right_gap = np.where(right, lines[..., 0] - lb[..., 2], np.inf)
+    below = value_lines & (lines[..., 1] >= lb[..., 3] - 1) & \
+        (lines[..., 1] - lb[..., 3] <= MAX_BELOW_GAP * height) & \
+        (lines[..., 0] < lb[..., 2]) & (lines[..., 2] > lb[..., 0])
+    below_gap = np.where(below, lines[..., 1] - lb[..., 3], np.inf)
+    right_lines = right_gap.argmin(axis=1)
+    has_right = np.isfinite(right_gap.min(axis=1))
+    below_lines = below_gap.argmin(axis=1)
+    has_below = np.isfinite(below_gap.min(axis=1))
+
+    key_values = []
+    for i, label in enumerate(labels):
+        key = " ".join(texts[label_starts[i]:label + 1]).rstrip(":").strip()
+        if has_inline[i]:
+            relation, start, end = "same_line", label + 1, inline_ends[i]
+        elif has_right[i]:
+            line = right_lines[i]
+            relation, start, end = "next_column", line_starts[line], line_value_ends[line]
+        elif has_below[i]:
+            line = below_lines[i]
+            relation, start, end = "below", line_starts[line], line_value_ends[line]
+        else:
+            continue
+        value = " ".join(texts[start:end]).strip()
+        if not key or not value:
+            continue
+
+        value_box = np.concatenate(
+            [boxes[start:end, :2].min(axis=0), boxes[start:end, 2:].max(axis=0)])
+        key_values.append({
+            "key": key,
+            "value": value,
+            "page": page.number + 1,
+            "relation": relation,
+            "key_bbox": [round(float(v), 1) for v in label_boxes[i]],
+            "value_bbox": [round(float(v), 1) for v in value_box],
+        })
+    return key_values
+
+
+def rulings(drawings):
+    # Horizontal (x0, x1, y) and vertical (y0, y1, x) rulings of the page
+    horizontal, vertical = [], []
+    for path in drawings:
+        for item in path["items"]:
+            if item[0] == "l":
+                start, end = item[1], item[2]
+                if abs(start.y - end.y) <= RULING_TOLERANCE < abs(start.x - end.x):
+                    horizontal.append((min(start.x, end.x), max(start.x, end.x),
+                                       (start.y + end.y) / 2))
+                elif abs(start.x - end.x) <= RULING_TOLERANCE < abs(start.y - end.y):
+                    vertical.append((min(start.y, end.y), max(start.y, end.y),
+                                     (start.x + end.x) / 2))
+            elif item[0] == "re":
+                rect = item[1]
+                if rect.height <= MAX_RULING_WIDTH and rect.width > rect.height:
+                    horizontal.append((rect.x0, rect.x1, (rect.y0 + rect.y1) / 2))
+                elif rect.width <= MAX_RULING_WIDTH and rect.height > rect.width:
+                    vertical.append((rect.y0, rect.y1, (rect.x0 + rect.x1) / 2))
+    return (np.array(horizontal, dtype=float).reshape(-1, 3),
+            np.array(vertical, dtype=float).reshape(-1, 3))
+
+
+def has_ruling_grid(drawings):
+    horizontal, vertical = rulings(drawings)
+    if len(horizontal) < MIN_RULINGS or len(vertical) < MIN_RULINGS:
+        return False
+    h = horizontal[:, None, :]
+    v = vertical[None, :, :]
+    crosses = (h[..., 0] - RULING_SNAP <= v[..., 2]) & (v[..., 2] <= h[..., 1] + RULING_SNAP) & \
+        (v[..., 0] - RULING_SNAP <= h[..., 2]) & (h[..., 2] <= v[..., 1] + RULING_SNAP)
+    return (crosses.any(axis=1).sum() >= MIN_RULINGS
+            and crosses.any(axis=0).sum() >= MIN_RULINGS)
+
+
+def has_text_columns(page, textpage=None):
+    # Cells are runs of words on a line, rows are cells at the same height;
+    # the page has columns when enough rows of MIN_TEXT_COLUMNS or more cells
+    # start at the same x positions
+    words = page.get_text("words", textpage=textpage)
+    if not words:
+        return False
+    rows = np.array(words, dtype=object)
+    boxes = rows[:, :4].astype(float)
+    line_ids = rows[:, 5].astype(np.int64) * 100000 + rows[:, 6].astype(np.int64)
+    cell_start = np.r_[True, (line_ids[1:] != line_ids[:-1]) |
+                       (boxes[1:, 0] - boxes[:-1, 2] > COLUMN_GAP)]
+    cell_x = boxes[cell_start, 0]
+    cell_y = (boxes[cell_start, 1] + boxes[cell_start, 3]) / 2
+
+    order = np.argsort(cell_y, kind="stable")
+    row_of_cell = np.cumsum(np.r_[True, np.diff(cell_y[order]) > ROW_TOLERANCE])
+    in_table_row = np.bincount(row_of_cell)[row_of_cell] >= MIN_TEXT_COLUMNS
+    _, rows_per_start = np.unique(
+        np.round(cell_x[order][in_table_row] / ROW_TOLERANCE), return_counts=True)
+    return (rows_per_start >= MIN_TEXT_ROWS).sum() >= MIN_TEXT_COLUMNS
+
+
+def may_have_tables(page, drawings, textpage=None):
+    # The grid check is the cheap one, so the words are only read without it
+    return has_ruling_grid(drawings) or has_text_columns(page, textpage)
+
+
+def extract_tables(page, plumber_pdf=None, table_engine=TABLE_ENGINE, precheck=True,
+                   textpage=None):
+    # Rows of each table on the page, header row first
+    drawings = page.get_drawings()
+    if precheck and not may_have_tables(page, drawings, textpage):
+        return []
+    if table_engine == "pdfplumber":
+        plumber_page = plumber_pdf.pages[page.number]
+        try:
+            return plumber_page.extract_tables()
+        finally:
+            plumber_page.close()
+    # The drawings read for the pre-check are reused instead of read again
+    return [table.extract() for table in page.find_tables(paths=drawings).tables]
+
+
+def iter_pages(pdf_path, start=0, stop=None, table_engine=TABLE_ENGINE):
+    # Single pass over the document, opened once and walked page by page, so
+    # only one page is held at a time. pdfplumber is only opened as the
+    # table engine
+    plumber = pdfplumber.open(pdf_path) if table_engine == "pdfplumber" else nullcontext()
+    with fitz.open(pdf_path) as doc, plumber as plumber_pdf:
+        stop = doc.page_count if stop is None else stop
+        for page_number in range(start, stop):
+            page = doc[page_number]
+            # One text page serves both the plain text and the word boxes
+            with span("pdf.text", page=page_number + 1):
+                textpage = page.get_textpage()
+                text = page.get_text(textpage=textpage)
+
+            with span("pdf.tables", page=page_number + 1, engine=table_engine) as attrs:
+                tables = [pd.DataFrame(table[1:], columns=table[0])
+                          for table in extract_tables(page, plumber_pdf, table_engine,
+                                                           textpage=textpage)]
+                attrs["tables"] = len(tables)
+
+            with span("pdf.key_values", page=page_number + 1) as attrs:
+                key_values = extract_key_values(page, textpage)
+                attrs["pairs"] = len(key_values)
+
+            yield {
+                "page": page_number + 1,
+                "text": text,
+                "key_values": key_values,
+                "tables": tables,
+            }
+
+
+class ConsolidatedStore:
+    """Single SQLite dataset holding every table and key-value pair.
+
+    Each document's rows are replaced whole when it is re-extracted, and the
+    (doc, ...) indexes let one document be read back without a full scan.
+    """
+
+    SCHEMA = """
+    CREATE TABLE IF NOT EXISTS extracted_tables (
+        doc TEXT, page INTEGER, table_index INTEGER, columns TEXT);
+    CREATE TABLE IF NOT EXISTS table_rows (
+        doc TEXT, table_index INTEGER, row_index INTEGER, cells TEXT);
+    CREATE TABLE IF NOT EXISTS key_values (
+        doc TEXT, page INTEGER, key TEXT, value TEXT, relation TEXT,
+        x0 REAL, y0 REAL, x1 REAL, y1 REAL);
+    CREATE INDEX IF NOT EXISTS idx_tables_doc
+        ON extracted_tables (doc, table_index);
+    CREATE INDEX IF NOT EXISTS idx_rows_doc
+        ON table_rows (doc, table_index, row_index);
+    CREATE INDEX IF NOT EXISTS idx_key_values_doc ON key_values (doc, page);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # A new extractor version re-extracts everything, so an older store
+        # (possibly with an older schema) is simply rebuilt
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        if version != EXTRACTOR_VERSION:
+            self.conn.executescript("""
+            DROP TABLE IF EXISTS extracted_tables;
+            DROP TABLE IF EXISTS table_rows;
+            DROP TABLE IF EXISTS key_values;
+            """)
+            self.conn.execute(f"PRAGMA user_version = {EXTRACTOR_VERSION}")
+        self.conn.executescript(self.SCHEMA)
+
+    def remove_document(self, doc):
+        for table in ("extracted_tables", "table_rows", "key_values"):
+            self.conn.execute(f"DELETE FROM {table} WHERE doc = ?", (doc,))
+        self.conn.commit()
+
+    def add_page(self, doc, page, first_table_index):
+        self.conn.executemany(
+            "INSERT INTO key_values VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            [(doc, kv["page"], kv["key"], kv["value"], kv["relation"], *kv["key_bbox"])
+             for kv in page["key_values"]])
+
+        for table_index, table_df in enumerate(page["tables"], first_table_index):
+            self.conn.execute(
+                "INSERT INTO extracted_tables VALUES (?, ?, ?, ?)",
+                (doc, page["page"], table_index, json.dumps(list(table_df.columns))))
+            self.conn.executemany(
+                "INSERT INTO table_rows VALUES (?, ?, ?, ?)",
+                ((doc, table_index, row_index, json.dumps(list(row)))
+                 for row_index, row in enumerate(
+                     table_df.itertuples(index=False, name=None))))
+
+    def commit(self):
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+def read_store_tables(store_path, doc):
+    conn = sqlite3.connect(store_path)
+    try:
+        headers = conn.execute(
+            "SELECT table_index, columns FROM extracted_tables "
+            "WHERE doc = ? ORDER BY table_index", (doc,)).fetchall()
+        rows = {table_index: [] for table_index, _ in headers}
+        for table_index, cells in conn.execute(
+                "SELECT table_index, cells FROM table_rows "
+                "WHERE doc = ? ORDER BY table_index, row_index", (doc,)):
+            rows[table_index].append(json.loads(cells))
+    finally:
+        conn.close()
+    return [pd.DataFrame(rows[table_index], columns=json.loads(columns))
+            for table_index, columns in headers]
+
+
+def read_store_key_values(store_path, doc):
+    conn = sqlite3.connect(store_path)
+    try:
+        return conn.execute(
+            "SELECT page, key, value, relation, x0, y0, x1, y1 FROM key_values "
+            "WHERE doc = ? ORDER BY page, rowid", (doc,)).fetchall()
+    finally:
+        conn.close()
+
+
+class PageWriter:
+    """Writes page results to the text, JSON and CSV outputs as they arrive.
+
+    With a ConsolidatedStore the key-values and tables also go to the store;
+    write_files=False leaves the per-document files out entirely.
+    """
+
+    def __init__(self, pdf_name, write_files=True, store=None):
+        self.base_name = os.path.splitext(pdf_name)[0]
+        self.write_files = write_files
+        self.store = store
+        self.outputs = []
+        self.kv_count = 0
+        self.table_count = 0
+
+        if store is not None:
+            store.remove_document(self.base_name)
+        self.remove_stale_outputs()
+        if write_files:
+            text_path = os.path.join(TEXT_DIR, f"{self.base_name}_text.txt")
+            kv_path = os.path.join(KV_DIR, f"{self.base_name}_key_values.json")
+            self.outputs = [text_path, kv_path]
+            self.text_file = open(text_path, "w", encoding="utf-8")
+            self.kv_file = open(kv_path, "w", encoding="utf-8")
+            self.kv_file.write("[")
+
+    def remove_stale_outputs(self):
+        # Files left by a run the manifest does not know about (such as the
+        # outputs shipped in the repo) would otherwise outlive a run that finds
+        # fewer tables, or writes no files at all
+        for path in (os.path.join(TEXT_DIR, f"{self.base_name}_text.txt"),
+                     os.path.join(KV_DIR, f"{self.base_name}_key_values.json")):
+            if os.path.exists(path):
+                os.remove(path)
+        prefix = f"{self.base_name}_table_"
+        for name in os.listdir(TABLE_DIR):
+            number = name[len(prefix):-len(".csv")]
+            if name.startswith(prefix) and name.endswith(".csv") and number.isdigit():
+                os.remove(os.path.join(TABLE_DIR, name))
+
+    def write_page(self, page):
+        if self.store is not None:
+            self.store.add_page(self.base_name, page, self.table_count + 1)
+        if not self.write_files:
+            self.table_count += len(page["tables"])
+            return
+
+        self.text_file.write(page["text"] + "\n")
+
+        # Every occurrence is kept, so the JSON is a list streamed as it grows
+        for kv in page["key_values"]:
+            separator = "," if self.kv_count else ""
+            self.kv_file.write(f"{separator}\n    {json.dumps(kv)}")
+            self.kv_count += 1
+
+        for table_df in page["tables"]:
+            self.table_count += 1
+            csv_path = os.path.join(
+                TABLE_DIR, f"{self.base_name}_table_{self.table_count}.csv")
+            table_df.to_csv(csv_path, index=False)
+            self.outputs.append(csv_path)
+
+    def close(self):
+        if self.store is not None:
+            self.store.commit()
+        if self.write_files:
+            self.kv_file.write("\n]" if self.kv_count else "]")
+            self.kv_file.close()
+            self.text_file.close()
+
+    def discard(self):
+        # A failed document leaves no partial files or store rows behind
+        self.close()
+        for path in self.outputs:
+            if os.path.exists(path):
+                os.remove(path)
+        if self.store is not None:
+            self.store.remove_document(self.base_name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+# Incremental cache - output/manifest.json maps each PDF to the content hash,
+# extractor version, table engine and store/files settings it was processed
+# with, plus the files it produced
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest():
+    if not os.path.exists(MANIFEST_PATH):
+        return {}
+    with open(MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    tmp_path = MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(tmp_path, MANIFEST_PATH)
+
+
+def is_unchanged(entry, digest, store_path, table_engine=TABLE_ENGINE,
+                 write_files=True):
+    # Outputs count only if they were written for the same store and files
+    # settings as this run
+    return (entry is not None
+            and entry["sha256"] == digest
+            and entry["extractor_version"] == EXTRACTOR_VERSION
+            and entry.get("table_engine") == table_engine
+            and entry.get("store") == store_path
+            and entry.get("write_files", True) == write_files
+            and (store_path is None or os.path.exists(store_path))
+            and all(os.path.exists(os.path.join(OUTPUT_DIR, path))
+                    for path in entry["outputs"]))
+
+
+def remove_outputs(entry):
+    for path in entry["outputs"]:
+        path = os.path.join(OUTPUT_DIR, path)
+        if os.path.exists(path):
+            os.remove(path)
+    if entry.get("store") and os.path.exists(entry["store"]):
+        store = ConsolidatedStore(entry["store"])
+        store.remove_document(entry["doc"])
+        store.close()
+
+
+def process_all_pdfs(workers=1, pages_per_task=PAGES_PER_TASK, force=False,
+                     store_path=None, write_files=True, table_engine=TABLE_ENGINE):
+    pdf_files = [f for f in os.listdir(
+        INPUT_DIR) if f.lower().endswith(".pdf")]
+    manifest = load_manifest()
+
+    for pdf_file in sorted(set(manifest) - set(pdf_files)):
+        remove_outputs(manifest.pop(pdf_file))
+        print(f"Removed outputs of deleted file: {pdf_file}")
+
+    hashes = {}
+    for pdf_file in pdf_files:
+        digest = file_sha256(os.path.join(INPUT_DIR, pdf_file))
+        entry = manifest.get(pdf_file)
+        if not force and is_unchanged(entry, digest, store_path, table_engine,
+                                      write_files):
+            print(f"Unchanged, skipping: {pdf_file}")
+            continue
+        # A new run may produce fewer tables, so clear the old files first
+        if entry is not None:
+            remove_outputs(manifest.pop(pdf_file))
+        hashes[pdf_file] = digest
+
+    def record(pdf_file, outputs):
+        manifest[pdf_file] = {
+            "sha256": hashes[pdf_file],
+            "extractor_version": EXTRACTOR_VERSION,
+            "table_engine": table_engine,
+            "doc": os.path.splitext(pdf_file)[0],
+            "store": store_path,
+            "write_files": write_files,
+            "outputs": [os.path.relpath(path, OUTPUT_DIR) for path in outputs],
+        }
+
+    store = ConsolidatedStore(store_path) if store_path else None
+    try:
+        if workers > 1:
+            return process_pdfs_batch(
+                list(hashes), workers, pages_per_task, on_finished=record,
+                write_files=write_files, store=store, table_engine=table_engine)
+
+        failures = {}
+        for pdf_file in hashes:
+            pdf_path = os.path.join(INPUT_DIR, pdf_file)
+            print(f"Processing: {pdf_file}")
+
+            writer = PageWriter(pdf_file, write_files, store)
+            try:
+                for page in iter_pages(pdf_path, table_engine=table_engine):
+                    writer.write_page(page)
+            except Exception as e:
+                writer.discard()
+                failures[pdf_file] = str(e)
+                print(f"Failed: {pdf_file} -> {e}\n")
+                continue
+            writer.close()
+            record(pdf_file, writer.outputs)
+
+            print(f"Finished: {pdf_file}\n")
+        return failures
+    finally:
+        save_manifest(manifest)
+        if store is not None:
+            store.close()
+
+
+# Batch mode - runs in a worker process, one page range of one file; the
+# spans recorded there are returned with the pages
+def extract_page_range(pdf_path, start, stop, table_engine=TABLE_ENGINE):
+    with request_trace() as events:
+        pages = list(iter_pages(pdf_path, start, stop, table_engine))
+    return pages, events
+
+
+def page_ranges(pdf_path, pages_per_task):
+    with fitz.open(pdf_path) as doc:
+        page_count = doc.page_count
+    if page_count == 0:
+        return [(0, 0)]
+    return [(start, min(start + pages_per_task, page_count))
+            for start in range(0, page_count, pages_per_task)]
+
+
+def process_pdfs_batch(pdf_files, workers, pages_per_task=PAGES_PER_TASK,
+                       on_finished=None, write_files=True, store=None,
+                       table_engine=TABLE_ENGINE):
+    failures = {}
+    ranges_by_file = {}
+    # Finished ranges wait here until every earlier range of the same file
+    # has been written, so pages always reach the writer in order
+    completed = {}
+    writers = {}
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {}
+        for pdf_file in pdf_files:
+            pdf_path = os.path.join(INPUT_DIR, pdf_file)
+            try:
+                ranges = page_ranges(pdf_path, pages_per_task)
+            except Exception as e:
+                failures[pdf_file] = str(e)
+                continue
+
+            ranges_by_file[pdf_file] = [start for start, _ in ranges]
+            completed[pdf_file] = {}
+            for start, stop in ranges:
+                future = pool.submit(extract_page_range, pdf_path, start, stop,
+                                     table_engine)
+                futures[future] = (pdf_file, start)
+
+        for future in as_completed(futures):
+            # Dropping the future frees its pages once they are written
+            pdf_file, start = futures.pop(future)
+            if pdf_file in failures:
+                continue
+            try:
+                completed[pdf_file][start], events = future.result()
+                TRACER.add(events)
+
+                if pdf_file not in writers:
+                    writers[pdf_file] = PageWriter(pdf_file, write_files, store)
+                starts = ranges_by_file[pdf_file]
+                while starts and starts[0] in completed[pdf_file]:
+                    for page in completed[pdf_file].pop(starts.pop(0)):
+                        writers[pdf_file].write_page(page)
+            except Exception as e:
+                failures[pdf_file] = f"page {start + 1} onwards: {e}"
+                del completed[pdf_file]
+                if pdf_file in writers:
+                    writers.pop(pdf_file).discard()
+                continue
+
+            if not starts:
+                writer = writers.pop(pdf_file)
+                writer.close()
+                del completed[pdf_file]
+                if on_finished is not None:
+                    on_finished(pdf_file, writer.outputs)
+                print(f"Finished: {pdf_file}")
+
+    for pdf_file, error in failures.items():
+        print(f"Failed: {pdf_file} -> {error}")
+    return failures
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Extract text, key-values and tables from the PDFs in pdfs/")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes; more than 1 enables batch mode")
+    parser.add_argument("--pages-per-task", type=int, default=PAGES_PER_TASK,
+                        help="batch mode: pages of a large file handled per task")
+    parser.add_argument("--force", action="store_true",
+                        help="re-extract every PDF, ignoring output/manifest.json")
+    parser.add_argument("--store", metavar="PATH",
+                        help="also write all tables and key-values to one SQLite file")
+    parser.add_argument("--no-files", action="store_true",
+                        help="skip the per-document text/JSON/CSV files (needs --store)")
+    parser.add_argument("--table-engine", default=TABLE_ENGINE, choices=TABLE_ENGINES,
+                        help="pdfplumber is the slower original engine")
+    args = parser.parse_args()
+    if args.no_files and not args.store:
+        parser.error("--no-files needs --store")
+
+    process_all_pdfs(workers=args.workers,
+                     pages_per_task=args.pages_per_task, force=args.force,
+                     store_path=args.store, write_files=not args.no_files,
+                     table_engine=args.table_engine)
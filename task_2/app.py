@@ -1,156 +1,526 @@
-# chat with multiple pdf's
-import os
-import time
-import tempfile
-import streamlit as st
-from dotenv import load_dotenv
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-
-from langchain_community.document_loaders import (
-    PyPDFLoader,
-    Docx2txtLoader,
-    TextLoader,
-)
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_core.prompts import ChatPromptTemplate
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
-
-
-load_dotenv()
-groq_api_key = os.getenv("GROQ_API_KEY")
-os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
-
-LLM = ChatGroq(
-    groq_api_key=groq_api_key,
-    model_name="Llama3-8b-8192",
-    temperature=0.2,
-)
-
-EMBEDDINGS = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-
-# defining the prompt
-PROMPT = PromptTemplate.from_template(
-    """
-You are a helpful assistant. Use the following pieces of context to answer the question.
-If the answer is not contained in the context, say "I don't know".
-
-Context:
-{context}
-
-Question: {question}
-Answer:
-"""
-)
-
-
-st.set_page_config(page_title="RAG Chat", page_icon="🗂️", layout="wide")
-st.title("📄🔍 RAG Chat over Your Documents")
-
-with st.sidebar:
-    st.header("Upload Documents")
-    uploaded_files = st.file_uploader(
-        "Choose PDF, DOCX or TXT files",
-        type=["pdf", "docx", "txt"],
-        accept_multiple_files=True,
-    )
-    build_vectors = st.button("🔨 Build Knowledge‑Base")
-
-# maintaining session state here
-if "vector_store" not in st.session_state:
-    st.session_state.vector_store = None
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
-
-# Document loading and splitting,injecting into vectorDB
-def load_and_split(files):
-    docs = []
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000, chunk_overlap=200)
-
-    for file in files:
-        suffix = file.name.split(".")[-1].lower()
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=f".{suffix}") as tmp:
-            tmp.write(file.getbuffer())
-            tmp_path = tmp.name
-
-        if suffix == "pdf":
-            pages = PyPDFLoader(tmp_path).load_and_split()
-            docs.extend(pages)
-        elif suffix == "docx":
-            docs.extend(Docx2txtLoader(tmp_path).load_and_split())
-        elif suffix == "txt":
-            docs.extend(TextLoader(tmp_path).load_and_split())
-        else:
-            st.warning(f"Skipping unsupported file type: {file.name}")
-
-    return splitter.split_documents(docs)
-
-
-# After building Documents and splitting those are stored converted in to embedding and stored in VectorDB
-# VectorDB - used is FAISS
-if build_vectors:
-    if not uploaded_files:
-        st.warning("Please upload at least one document.")
-    else:
-        with st.spinner("Embedding and indexing…"):
-            documents = load_and_split(uploaded_files)
-            st.session_state.vector_store = FAISS.from_documents(
-                documents, EMBEDDINGS
-            )
-        st.success("✅ Knowledge‑base ready!")
-
-
-st.divider()
-st.header("💬 Chat with your documents")
-
-prompt_user = st.chat_input(
-    "Ask a question...",
-    disabled=st.session_state.vector_store is None,
-)
-
-
-def rag_answer(query):
-    # Ensure we have a valid vector store
-    if st.session_state.vector_store is None:
-        return {"answer": "No knowledge base found."}
-
-    retriever = st.session_state.vector_store.as_retriever()
-    relevant_docs = retriever.invoke(query)
-
-    context = "\n\n".join([doc.page_content for doc in relevant_docs])
-
-    final_prompt = PROMPT.format(context=context, question=query)
-
-    answer = LLM.invoke(final_prompt)
-
-    return {
-        "answer": answer.content,
-        "context": relevant_docs,
-    }
-
-
-if prompt_user:
-    with st.spinner("Thinking…"):
-        start = time.time()
-        result = rag_answer(prompt_user)
-        elapsed = time.time() - start
-
-    answer = result["answer"]
-    context_docs = result["context"]
-
-    # Display Q‑A
-    st.session_state.chat_history.append(("user", prompt_user))
-    st.session_state.chat_history.append(("ai", answer))
-
-    for role, msg in st.session_state.chat_history:
-        align = "user" if role == "user" else "assistant"
-        st.chat_message(align).write(msg)
-
-    
-
-    st.caption(f"⏱️ Response time: {elapsed:.2f}s")
+# chat with multiple pdf's
+import os
+import sys
+import json
+import time
+import pickle
+import hashlib
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+import streamlit as st
+from dotenv import load_dotenv
+
+# LangChain, FAISS and the Groq/Google clients take seconds to import, so they
+# are imported where first used: the page renders before they load, and
+# Streamlit's reruns find them already in sys.modules
+# Before the common/ imports, which read their settings from the environment
+load_dotenv()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.answer_cache import SemanticAnswerCache
+from common.instrumentation import (
+    TRACER, TRACE_CALLBACKS, breakdown, request_trace, span)
+
+
+groq_api_key = os.getenv("GROQ_API_KEY")
+os.environ["GOOGLE_API_KEY"] = os.getenv("GOOGLE_API_KEY")
+
+EMBEDDING_MODEL = "models/embedding-001"
+
+
+# Clients are built once per process and shared by every session and rerun
+@st.cache_resource
+def get_llm():
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        groq_api_key=groq_api_key,
+        model_name="Llama3-8b-8192",
+        temperature=0.2,
+        callbacks=TRACE_CALLBACKS,
+    )
+
+
+@st.cache_resource
+def get_embeddings():
+    # Vectors are cached on disk (shared with task_3), so re-indexing the same
+    # text never calls the embedding API twice; misses are sent in concurrent,
+    # rate-limited batches
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    from common.embedding_cache import CachedEmbeddings
+    from common.embedding_scheduler import EmbeddingScheduler
+
+    return CachedEmbeddings(
+        EmbeddingScheduler(GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)),
+        EMBEDDING_MODEL)
+
+# Persistent knowledge base: FAISS index + docstore on disk, and a manifest of
+# the chunk ids each uploaded file contributed. With VECTOR_INDEX set, the
+# index is an ANN one keyed by stable ids, and ann.json records its type and
+# the vector count it was trained on
+KB_DIR = "faiss_index"
+KB_INDEX = os.path.join(KB_DIR, "index.faiss")
+KB_ANN_META = os.path.join(KB_DIR, "ann.json")
+# Separate ANN copy written by earlier versions; removed on the next save
+KB_ANN_INDEX = os.path.join(KB_DIR, "ann.faiss")
+KB_DOCSTORE = os.path.join(KB_DIR, "index.pkl")
+KB_MANIFEST = os.path.join(KB_DIR, "manifest.json")
+KB_LEXICAL = os.path.join(KB_DIR, "bm25.pkl")
+
+# defining the prompt (filled in with str.format)
+PROMPT = """
+You are a helpful assistant. Use the following pieces of context to answer the question.
+If the answer is not contained in the context, say "I don't know".
+
+Context:
+{context}
+
+Question: {question}
+Answer:
+"""
+
+
+st.set_page_config(page_title="RAG Chat", page_icon="🗂️", layout="wide")
+st.title("📄🔍 RAG Chat over Your Documents")
+
+with st.sidebar:
+    st.header("Upload Documents")
+    uploaded_files = st.file_uploader(
+        "Choose PDF, DOCX or TXT files",
+        type=["pdf", "docx", "txt"],
+        accept_multiple_files=True,
+    )
+    build_vectors = st.button("🔨 Build Knowledge‑Base")
+    stream_answers = st.toggle("Stream answers", value=True)
+    show_timings = st.toggle("Show timing breakdown", value=False)
+
+
+@st.cache_resource
+def load_knowledge_base():
+    # Memory-mapped read-only copy, shared by every session until it changes
+    if not os.path.exists(KB_INDEX):
+        return None
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    from common.ann_index import set_search_params
+
+    index = faiss.read_index(KB_INDEX, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    if index.ntotal == 0:
+        return None
+    set_search_params(index)
+    with open(KB_DOCSTORE, "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(get_embeddings(), index, docstore, index_to_docstore_id)
+
+
+@st.cache_resource
+def load_lexical_index():
+    # BM25 index over the same chunks, saved alongside the FAISS files
+    from common.hybrid_retrieval import build_bm25_index
+
+    if os.path.exists(KB_LEXICAL):
+        with open(KB_LEXICAL, "rb") as f:
+            return pickle.load(f)
+    vector_store = load_knowledge_base()
+    return build_bm25_index(vector_store) if vector_store is not None else None
+
+
+def knowledge_base_version():
+    # Every save swaps in a new index file, so its mtime identifies the version
+    return os.stat(KB_INDEX).st_mtime_ns if os.path.exists(KB_INDEX) else None
+
+
+@st.cache_resource
+def answer_cache():
+    # Shared by all sessions; cleared by itself when the knowledge base changes
+    return SemanticAnswerCache()
+
+
+def load_kb_manifest():
+    if not os.path.exists(KB_MANIFEST):
+        return {}
+    with open(KB_MANIFEST, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def load_ann_meta():
+    if not os.path.exists(KB_ANN_META):
+        return None
+    with open(KB_ANN_META, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_knowledge_base(vector_store, manifest, ann_meta=None):
+    # Written next to the live files and swapped in, so sessions that still
+    # have the old index memory-mapped keep reading a complete file
+    from common.hybrid_retrieval import build_bm25_index
+
+    tmp_dir = os.path.join(KB_DIR, "tmp")
+    vector_store.save_local(tmp_dir)
+    with open(os.path.join(tmp_dir, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=4)
+    with open(os.path.join(tmp_dir, "bm25.pkl"), "wb") as f:
+        pickle.dump(build_bm25_index(vector_store), f)
+    paths = [KB_INDEX, KB_DOCSTORE, KB_MANIFEST, KB_LEXICAL]
+    if ann_meta is not None:
+        with open(os.path.join(tmp_dir, "ann.json"), "w", encoding="utf-8") as f:
+            json.dump(ann_meta, f)
+        paths.append(KB_ANN_META)
+    if os.path.exists(KB_ANN_INDEX):
+        os.remove(KB_ANN_INDEX)
+    for path in paths:
+        os.replace(os.path.join(tmp_dir, os.path.basename(path)), path)
+    os.rmdir(tmp_dir)
+    load_knowledge_base.clear()
+    load_lexical_index.clear()
+
+
+def chunk_ids(file_name, chunks):
+    # Ids follow chunk content, so an edited file only re-embeds changed chunks
+    ids, seen = [], {}
+    for chunk in chunks:
+        digest = hashlib.sha256(
+            f"{file_name}\n{chunk.page_content}".encode("utf-8")).hexdigest()
+        seen[digest] = seen.get(digest, 0) + 1
+        ids.append(f"{digest}-{seen[digest]}")
+    return ids
+
+
+with st.sidebar:
+    indexed_files = sorted(load_kb_manifest())
+    if indexed_files:
+        st.header("Knowledge‑Base")
+        files_to_remove = st.multiselect("Indexed documents", indexed_files)
+        remove_vectors = st.button("🗑️ Remove selected")
+    else:
+        files_to_remove, remove_vectors = [], False
+
+# maintaining session state here
+if "chat_history" not in st.session_state:
+    st.session_state.chat_history = []
+
+# Uploads are parsed from memory in worker processes: PyMuPDF holds the GIL
+# while it reads a PDF, so threads would parse one file at a time. "spawn"
+# keeps the workers from inheriting the Streamlit server's threads and locks
+PARSE_WORKERS = int(os.getenv("PARSE_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+
+@st.cache_resource
+def parse_pool():
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    return ProcessPoolExecutor(
+        max_workers=PARSE_WORKERS,
+        mp_context=multiprocessing.get_context("spawn"))
+
+
+def parse_uploads(files, on_parsed=None):
+    # Yields (file, pages) as each file finishes parsing, in any order
+    from concurrent.futures import as_completed
+    from upload_parsing import SUPPORTED_TYPES, file_type, parse_upload
+
+    futures = {}
+    for file in files:
+        if file_type(file.name) not in SUPPORTED_TYPES:
+            st.warning(f"Skipping unsupported file type: {file.name}")
+            continue
+        futures[parse_pool().submit(parse_upload, file.name, file.getvalue())] = file
+    for done, future in enumerate(as_completed(futures), 1):
+        file = futures[future]
+        if on_parsed is not None:
+            on_parsed(done, len(futures), file.name)
+        # A corrupt or password-protected file only fails itself
+        try:
+            pages, events = future.result()
+        except Exception as e:
+            st.warning(f"Could not read {file.name}: {e}")
+            continue
+        TRACER.add(events)
+        yield file, pages
+
+
+def split_pages(pages):
+    # Chunks never cross a page boundary and keep the page's metadata
+    from langchain_core.documents import Document
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=1000, chunk_overlap=200)
+    docs = [Document(page_content=text, metadata=metadata)
+            for text, metadata in pages]
+    with span("chunking", pages=len(docs)) as attrs:
+        chunks = splitter.split_documents(docs)
+        attrs["chunks"] = len(chunks)
+    return chunks
+
+
+def update_ann_store(vector_store, ann_meta, stale_ids, new_docs, new_ids,
+                     on_progress=None):
+    # ANN indexes key vectors by stable ids rather than positions, so the
+    # trained index is kept and updated in place. It is rebuilt only when the
+    # vector count drifts too far from its training count (needs_retrain),
+    # VECTOR_INDEX changes, or it cannot delete in place (HNSW). Rebuilds get
+    # the vectors back from the embedding cache, not the API
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from common.ann_index import INDEX_TYPE, build_index, needs_retrain, remove_ids
+    from common.embedding_scheduler import iter_embeddings
+
+    embeddings = get_embeddings()
+    if vector_store is None:
+        vector_store = FAISS(embeddings, None, InMemoryDocstore(), {})
+    id_map = vector_store.index_to_docstore_id
+    rebuild = ann_meta is None or ann_meta["index_type"] != INDEX_TYPE
+
+    stale = set(stale_ids)
+    stale_keys = [key for key, doc_id in id_map.items() if doc_id in stale]
+    if stale_keys:
+        if not rebuild:
+            rebuild = not remove_ids(vector_store.index, stale_keys)
+        vector_store.docstore.delete([id_map.pop(key) for key in stale_keys])
+
+    texts = [doc.page_content for doc in new_docs]
+    next_key = max(id_map, default=-1) + 1
+    done = 0
+    for positions, vectors in iter_embeddings(embeddings, texts):
+        keys = [next_key + i for i in positions]
+        if not rebuild:
+            vector_store.index.add_with_ids(
+                np.asarray(vectors, dtype=np.float32), np.asarray(keys, dtype=np.int64))
+        vector_store.docstore.add({new_ids[i]: new_docs[i] for i in positions})
+        id_map.update(zip(keys, (new_ids[i] for i in positions)))
+        done += len(positions)
+        if on_progress is not None:
+            on_progress(done, len(texts))
+
+    count = len(id_map)
+    if count == 0:
+        vector_store.index.reset()
+    elif rebuild or needs_retrain(INDEX_TYPE, ann_meta["trained_on"], count):
+        keys = list(id_map)
+        with span("ann.rebuild", vectors=count, index_type=INDEX_TYPE):
+            vectors = embeddings.embed_documents(
+                [vector_store.docstore.search(id_map[key]).page_content for key in keys])
+            vector_store.index = build_index(vectors, INDEX_TYPE, ids=keys)
+        ann_meta = {"index_type": INDEX_TYPE, "trained_on": count}
+    return vector_store, ann_meta
+
+
+# Embeds only chunks the index does not have yet and deletes the vectors of
+# removed files or of chunks that changed
+def update_knowledge_base(files=(), remove=(), on_progress=None, on_parsed=None):
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    from common.ann_index import INDEX_TYPE
+    from common.embedding_scheduler import index_documents
+
+    manifest = load_kb_manifest()
+    ann_meta = load_ann_meta()
+    vector_store = None
+    if os.path.exists(KB_INDEX):
+        # Writable in-memory copy; the shared one is memory-mapped read-only
+        # (for an ANN index, only the compact trained index is read)
+        with open(KB_DOCSTORE, "rb") as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+        vector_store = FAISS(get_embeddings(), faiss.read_index(KB_INDEX),
+                             docstore, index_to_docstore_id)
+
+    stale_ids = []
+    for name in remove:
+        stale_ids.extend(manifest.pop(name, []))
+
+    new_docs, new_ids = [], []
+    for file, pages in parse_uploads(files, on_parsed):
+        chunks = split_pages(pages)
+        ids = chunk_ids(file.name, chunks)
+        old_ids = set(manifest.get(file.name, []))
+        stale_ids.extend(old_ids - set(ids))
+        for chunk, chunk_id in zip(chunks, ids):
+            if chunk_id not in old_ids:
+                new_docs.append(chunk)
+                new_ids.append(chunk_id)
+        manifest[file.name] = ids
+
+    if INDEX_TYPE == "flat" and ann_meta is None:
+        if vector_store is not None and stale_ids:
+            vector_store.delete(stale_ids)
+        if new_docs:
+            vector_store = index_documents(
+                new_docs, get_embeddings(), vector_store, ids=new_ids,
+                on_progress=on_progress)
+    elif vector_store is not None or new_docs:
+        vector_store, ann_meta = update_ann_store(
+            vector_store, ann_meta, stale_ids, new_docs, new_ids, on_progress)
+
+    if vector_store is not None:
+        save_knowledge_base(vector_store, manifest, ann_meta)
+    return len(new_docs), len(stale_ids)
+
+
+# After building Documents and splitting those are stored converted in to embedding and stored in VectorDB
+# VectorDB - used is FAISS
+if build_vectors:
+    if not uploaded_files:
+        st.warning("Please upload at least one document.")
+    else:
+        with st.spinner("Embedding and indexing…"):
+            progress = st.progress(0.0, text="Parsing documents…")
+            added, removed = update_knowledge_base(
+                files=uploaded_files,
+                on_parsed=lambda done, total, name: progress.progress(
+                    done / total, text=f"Parsed {done}/{total} files ({name})"),
+                on_progress=lambda done, total: progress.progress(
+                    done / total, text=f"Embedded {done}/{total} chunks"))
+        st.success(
+            f"✅ Knowledge‑base ready! ({added} new chunks embedded, {removed} removed)")
+
+if remove_vectors and files_to_remove:
+    with st.spinner("Removing documents…"):
+        _, removed = update_knowledge_base(remove=files_to_remove)
+    st.success(f"🗑️ Removed {len(files_to_remove)} document(s), {removed} chunks")
+
+
+st.divider()
+st.header("💬 Chat with your documents")
+
+prompt_user = st.chat_input(
+    "Ask a question...",
+    disabled=knowledge_base_version() is None,
+)
+
+# The knowledge base on disk is shared by all sessions; it is only opened
+# once a question needs it, so reruns without one stay cheap
+if prompt_user:
+    st.session_state.vector_store = load_knowledge_base()
+    st.session_state.lexical_index = load_lexical_index()
+    if st.session_state.vector_store is None:
+        st.warning("The knowledge base is empty. Upload documents first.")
+        st.stop()
+
+
+@st.cache_resource
+def retrieval_pool():
+    return ThreadPoolExecutor(max_workers=4)
+
+
+def retrieve_context(vector_store, lexical_index, query):
+    # BM25 + dense fusion; keyword-style questions skip the embedding call
+    from common.hybrid_retrieval import HybridRetriever
+
+    retriever = HybridRetriever(
+        vector_store=vector_store, lexical_index=lexical_index)
+    with span("retrieval"):
+        relevant_docs = retriever.invoke(query)
+
+    context = "\n\n".join([doc.page_content for doc in relevant_docs])
+
+    final_prompt = PROMPT.format(context=context, question=query)
+    return relevant_docs, final_prompt
+
+
+def rag_answer(query):
+    # Ensure we have a valid vector store
+    if st.session_state.vector_store is None:
+        return {"answer": "No knowledge base found."}
+
+    relevant_docs, final_prompt = retrieve_context(
+        st.session_state.vector_store, st.session_state.lexical_index, query)
+
+    answer = get_llm().invoke(final_prompt)
+
+    return {
+        "answer": answer.content,
+        "context": relevant_docs,
+    }
+
+
+def stream_answer(retrieval, start, timings):
+    # Yields answer tokens as they arrive; timings gets time to first token
+    # and total latency, both measured from when the question came in
+    relevant_docs, final_prompt = retrieval.result()
+    timings["retrieval"] = time.perf_counter() - start
+    timings["context"] = relevant_docs
+
+    for chunk in get_llm().stream(final_prompt):
+        if "first_token" not in timings:
+            timings["first_token"] = time.perf_counter() - start
+        yield chunk.content
+    timings["total"] = time.perf_counter() - start
+
+
+if prompt_user:
+    from common.hybrid_retrieval import is_keyword_query
+
+    # Every span recorded while answering goes into trace_events
+    with request_trace() as trace_events:
+        start = time.perf_counter()
+        timings = {}
+        kb_version = knowledge_base_version()
+        # Keyword-style questions take the lexical fast path, so they skip the
+        # semantic cache instead of paying for an embedding call
+        use_answer_cache = not is_keyword_query(prompt_user)
+        cached = None
+        if use_answer_cache:
+            with span("embedding.query"):
+                question_vector = get_embeddings().embed_query(prompt_user)
+            with span("answer_cache.lookup"):
+                cached = answer_cache().lookup(kb_version, question_vector)
+
+        if stream_answers and cached is None:
+            # Retrieval and prompt assembly run in the background while the
+            # chat history is drawn, then tokens are rendered as they arrive.
+            # The copied context keeps the worker's spans in this trace
+            retrieval = retrieval_pool().submit(
+                contextvars.copy_context().run, retrieve_context,
+                st.session_state.vector_store, st.session_state.lexical_index,
+                prompt_user)
+
+        for role, msg in st.session_state.chat_history:
+            align = "user" if role == "user" else "assistant"
+            st.chat_message(align).write(msg)
+        st.chat_message("user").write(prompt_user)
+
+        if cached is not None:
+            result, similarity = cached
+            answer = result["answer"]
+            timings["total"] = time.perf_counter() - start
+            st.chat_message("assistant").write(answer)
+        elif stream_answers:
+            with st.chat_message("assistant"):
+                answer = st.write_stream(stream_answer(retrieval, start, timings))
+            if use_answer_cache:
+                answer_cache().store(kb_version, question_vector,
+                                     {"answer": answer, "context": timings["context"]})
+        else:
+            with st.spinner("Thinking…"):
+                result = rag_answer(prompt_user)
+            answer = result["answer"]
+            timings["total"] = time.perf_counter() - start
+            st.chat_message("assistant").write(answer)
+            if use_answer_cache:
+                answer_cache().store(kb_version, question_vector, result)
+
+        st.session_state.chat_history.append(("user", prompt_user))
+        st.session_state.chat_history.append(("ai", answer))
+
+        if cached is not None:
+            st.caption(
+                f"⚡ Cached answer (similarity {similarity:.2f}) · "
+                f"Response time: {timings['total']:.2f}s")
+        elif "first_token" in timings:
+            st.caption(
+                f"⏱️ First token: {timings['first_token']:.2f}s · "
+                f"Retrieval: {timings['retrieval']:.2f}s · Total: {timings['total']:.2f}s")
+        else:
+            st.caption(f"⏱️ Response time: {timings['total']:.2f}s")
+
+    if show_timings:
+        with st.expander("Timing breakdown", expanded=True):
+            st.dataframe(breakdown(trace_events), hide_index=True)
+
+with st.sidebar:
+    stats = answer_cache().stats()
+    st.caption(
+        f"Answer cache: {stats['hits']} hits · {stats['misses']} misses · "
+        f"{stats['entries']} cached")
@@ -0,0 +1,38 @@
+# Reads uploaded PDF, DOCX and TXT files straight from their bytes, with no
+# temp files. Runs in worker processes, so it returns plain (text, metadata)
+# pages and its spans rather than LangChain Documents
+import io
+import os
+import sys
+import fitz  # PyMuPDF
+import docx2txt
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.instrumentation import request_trace, span
+
+SUPPORTED_TYPES = ("pdf", "docx", "txt")
+
+
+def file_type(name):
+    return name.rsplit(".", 1)[-1].lower()
+
+
+def read_pages(name, data):
+    # One page per PDF page, one for a whole DOCX or TXT file
+    suffix = file_type(name)
+    if suffix == "pdf":
+        with fitz.open(stream=data, filetype="pdf") as doc:
+            return [(page.get_text(), {"source": name, "page": page.number + 1})
+                    for page in doc]
+    if suffix == "docx":
+        return [(docx2txt.process(io.BytesIO(data)), {"source": name})]
+    if suffix == "txt":
+        return [(data.decode("utf-8", errors="replace"), {"source": name})]
+    raise ValueError(f"Unsupported file type: {name}")
+
+
+def parse_upload(name, data):
+    with request_trace() as events, span("parse", file=name) as attrs:
+        pages = read_pages(name, data)
+        attrs["pages"] = len(pages)
+    return pages, events
@@ -0,0 +1,99 @@
+import os
+import sys
+import time
+import argparse
+import numpy as np
+import faiss
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.ann_index import MIN_ANN_VECTORS, build_index, index_kind, set_search_params
+
+# Compares the exact flat index with the approximate ones on synthetic,
+# clustered vectors (no documents or embedding API needed): recall@k against
+# exact search, queries per second, build time and serialized index size.
+# Every requested type is really built, even below MIN_ANN_VECTORS where the
+# apps would fall back to flat, and each row names the type that was built.
+
+
+def synthetic_vectors(count, dim, clusters, seed, latent_dim=64):
+    # Gaussian blobs (topic clusters) in a low-dimensional latent space,
+    # projected up to dim: text embeddings have a low intrinsic dimension
+    rng = np.random.default_rng(seed)
+    latent_dim = min(latent_dim, dim)
+    centers = rng.standard_normal((clusters, latent_dim))
+    labels = rng.integers(clusters, size=count)
+    latent = centers[labels] + rng.standard_normal((count, latent_dim)) * 0.5
+    projection = rng.standard_normal((latent_dim, dim)) / np.sqrt(latent_dim)
+    noise = rng.standard_normal((count, dim)) * 0.05
+    return (latent @ projection + noise).astype(np.float32)
+
+
+def recall_at_k(found, truth):
+    k = truth.shape[1]
+    hits = sum(len(set(row[:k]) & set(exact)) for row, exact in zip(found, truth))
+    return hits / truth.size
+
+
+def timed_search(index, queries, k):
+    start = time.perf_counter()
+    _, found = index.search(queries, k)
+    return found, len(queries) / (time.perf_counter() - start)
+
+
+def run_benchmark(count, dim, query_count, k, index_types, nprobes, ef_searches,
+                  seed=0):
+    data = synthetic_vectors(count + query_count, dim, clusters=max(1, count // 500),
+                             seed=seed)
+    vectors, queries = data[:count], data[count:]
+    print(f"Vectors: {count} x {dim}, queries: {query_count}, k={k}")
+    if count < MIN_ANN_VECTORS:
+        print(f"Note: below {MIN_ANN_VECTORS} vectors the apps build a flat index "
+              f"whatever VECTOR_INDEX is set to")
+
+    start = time.perf_counter()
+    exact = build_index(vectors, "flat")
+    build_seconds = time.perf_counter() - start
+    truth, qps = timed_search(exact, queries, k)
+    print(f"{'index':8}{'search param':>14}{'recall@k':>10}{'QPS':>10}"
+          f"{'build s':>10}{'MB':>10}")
+    print(f"{'flat':8}{'-':>14}{1.0:10.3f}{qps:10.0f}{build_seconds:10.2f}"
+          f"{faiss.serialize_index(exact).nbytes / 2**20:10.1f}")
+
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_index(vectors, index_type, seed=seed, min_vectors=0)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 2**20
+        built = index_kind(index)
+        if built != index_type:
+            print(f"Warning: asked for {index_type} but got a {built} index")
+
+        name, values = ("efSearch", ef_searches) if index_type == "hnsw" \
+            else ("nprobe", nprobes)
+        for value in values:
+            set_search_params(index, **{"nprobe" if name == "nprobe"
+                                        else "ef_search": value})
+            found, qps = timed_search(index, queries, k)
+            print(f"{built:8}{f'{name}={value}':>14}"
+                  f"{recall_at_k(found, truth):10.3f}{qps:10.0f}"
+                  f"{build_seconds:10.2f}{size_mb:10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark approximate vector indexes against exact search")
+    parser.add_argument("--vectors", type=int, default=100000,
+                        help="synthetic corpus size")
+    parser.add_argument("--dim", type=int, default=768,
+                        help="vector dimension (768 for models/embedding-001)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--index", nargs="+", default=["ivf", "ivfpq", "hnsw"],
+                        choices=["ivf", "ivfpq", "hnsw"])
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[4, 16, 64],
+                        help="IVF lists probed per query")
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 64, 256],
+                        help="HNSW candidate list size")
+    args = parser.parse_args()
+    run_benchmark(args.vectors, args.dim, args.queries, args.k, args.index,
+                  args.nprobe, args.ef_search)
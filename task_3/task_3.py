@@ -1,108 +1,314 @@
-import os,fitz
-from langchain_groq import ChatGroq
-from langchain.prompts import PromptTemplate
-from dotenv import load_dotenv
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.document_loaders import (
-    PyPDFLoader,
-    Docx2txtLoader,
-    TextLoader,
-)
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains import create_retrieval_chain
-from langchain.chains import RetrievalQA
-load_dotenv()
-
-# Load keys
-load_dotenv()
-google_api_key = os.getenv("GOOGLE_API_KEY")
-groq_api_key = os.getenv("GROQ_API_KEY")
-
-
-def load_documents_from_folder(folder_path):
-    all_text = ""
-    for file_name in os.listdir(folder_path):
-        file_path = os.path.join(folder_path, file_name)
-        ext = os.path.splitext(file_name)[-1].lower()
-        if ext == ".pdf":
-            doc = fitz.open(file_path)
-            all_text += "\n".join(page.get_text() for page in doc)
-        elif ext == ".txt":
-            with open(file_path, "r", encoding="utf-8") as f:
-                all_text += f.read()
-    return all_text
-
-
-def vector_embeddings(text):
-    embeddings = GoogleGenerativeAIEmbeddings(model="models/embedding-001")
-    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=150)
-    chunks = splitter.split_text(text)
-    vectorstore = FAISS.from_texts(chunks, embeddings)
-    return vectorstore, chunks
-
-def get_llm():
-    llm = ChatGroq(
-        groq_api_key=groq_api_key,
-        model_name="Llama3-8b-8192",
-        temperature=0.2,
-    )
-    return llm
-
-def build_qa_chain(vectorstore):
-    llm = get_llm()
-    prompt = PromptTemplate(
-        template="""
-        You are a helpful assistant. Use the following pieces of context to answer the question.
-        If the answer is not contained in the context, say "I don't know".
-        <context>
-        {context}
-        <context>
-        Questions:{question}
-        """,
-        input_variables=["question","context"]
-    )
-
-    chain =  RetrievalQA.from_chain_type(
-        llm=llm,
-        retriever=vectorstore.as_retriever(),
-        chain_type_kwargs={"prompt": prompt},
-        return_source_documents=True,
-    )
-
-    return chain
-
-
-def run_rag_pipeline(doc_path):
-    print(" Loading document...")
-    text = load_documents_from_folder(doc_path)
-
-    print(" Creating embeddings and vectorstore...")
-    vectorstore, chunks = vector_embeddings(text)
-
-    print("|-> RAG system ready. Ask questions (type 'exit' to quit):")
-    qa_chain = build_qa_chain(vectorstore)
-
-    while True:
-        user_question = input("\n💬 You: ")
-        if user_question.lower() in ["exit", "quit"]:
-            print(" Exiting chat.")
-            break
-
-        result = qa_chain.invoke({"query": user_question})
-
-        print("\n|-> Answer:")
-        print(result['result'])
-
-        print("\n Source Chunks Used:")
-        for i, doc in enumerate(result['source_documents']):
-            print(f"\n--- Chunk {i+1} ---")
-            print(doc.page_content)
-
-
-
-if __name__ == "__main__":
-    folder_path = "knowledge_base"
-    
-    run_rag_pipeline(folder_path)
+import os,sys,fitz,hashlib,json,time,argparse
+from langchain_groq import ChatGroq
+from langchain.prompts import PromptTemplate
+from dotenv import load_dotenv
+from langchain_google_genai import GoogleGenerativeAIEmbeddings
+from langchain_community.document_loaders import (
+    PyPDFLoader,
+    Docx2txtLoader,
+    TextLoader,
+)
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain.chains.combine_documents import create_stuff_documents_chain
+from langchain.chains import create_retrieval_chain
+from langchain.chains import RetrievalQA
+from langchain_core.documents import Document
+from concurrent.futures import ProcessPoolExecutor
+
+# Loaded before common/ so EMBEDDING_*, VECTOR_INDEX etc. in .env take effect
+load_dotenv()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.embedding_cache import CachedEmbeddings
+from common.embedding_scheduler import EmbeddingScheduler, index_documents
+from common.answer_cache import SemanticAnswerCache
+from common.hybrid_retrieval import (
+    HybridRetriever, build_bm25_index, dense_search_ids, fuse_rankings,
+    is_keyword_query)
+from common.ann_index import INDEX_TYPE, with_ann_index
+from common.instrumentation import TRACER, TRACE_CALLBACKS, request_trace, span
+
+# Load keys
+google_api_key = os.getenv("GOOGLE_API_KEY")
+groq_api_key = os.getenv("GROQ_API_KEY")
+
+
+def iter_file_pages(file_path):
+    # One Document per PDF page (or per TXT file), tagged with file and page
+    file_name = os.path.basename(file_path)
+    ext = os.path.splitext(file_name)[-1].lower()
+    if ext == ".pdf":
+        with fitz.open(file_path) as doc:
+            for page in doc:
+                yield Document(page_content=page.get_text(),
+                               metadata={"source": file_name, "page": page.number + 1})
+    elif ext == ".txt":
+        with open(file_path, "r", encoding="utf-8") as f:
+            yield Document(page_content=f.read(), metadata={"source": file_name})
+
+
+def chunk_file(file_path):
+    # Chunks never cross a file or page boundary and keep their metadata.
+    # Runs in a worker process, so its spans are returned with the chunks
+    splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=150)
+    chunks = []
+    with request_trace() as events, span("chunking", file=os.path.basename(file_path)) as attrs:
+        for page in iter_file_pages(file_path):
+            chunks.extend(splitter.split_documents([page]))
+        attrs["chunks"] = len(chunks)
+    return chunks, events
+
+
+def load_documents_from_folder(folder_path, workers=None):
+    # Files are parsed and chunked in parallel; yields each file's chunks
+    file_paths = [os.path.join(folder_path, file_name)
+                  for file_name in sorted(os.listdir(folder_path))
+                  if os.path.splitext(file_name)[-1].lower() in (".pdf", ".txt")]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for chunks, events in pool.map(chunk_file, file_paths):
+            TRACER.add(events)
+            yield chunks
+
+
+EMBEDDING_MODEL = "models/embedding-001"
+
+
+def vector_embeddings(file_chunks, index_type=INDEX_TYPE):
+    # Disk cache shared with task_2: unchanged chunks are not re-embedded, and
+    # misses are embedded in concurrent, rate-limited batches
+    embeddings = CachedEmbeddings(
+        EmbeddingScheduler(GoogleGenerativeAIEmbeddings(model=EMBEDDING_MODEL)),
+        EMBEDDING_MODEL)
+    # Each file is added to the index as soon as it has been chunked
+    vectorstore, chunks = None, []
+    for file_chunk_list in file_chunks:
+        with span("index.add", chunks=len(file_chunk_list)):
+            vectorstore = index_documents(file_chunk_list, embeddings, vectorstore)
+        chunks.extend(file_chunk_list)
+    # Large corpora search an IVF/HNSW/PQ index trained on a sample instead
+    # of the exact flat one
+    return with_ann_index(vectorstore, index_type), chunks
+
+def get_llm():
+    llm = ChatGroq(
+        groq_api_key=groq_api_key,
+        model_name="Llama3-8b-8192",
+        temperature=0.2,
+        callbacks=TRACE_CALLBACKS,
+    )
+    return llm
+
+QA_PROMPT = PromptTemplate(
+    template="""
+        You are a helpful assistant. Use the following pieces of context to answer the question.
+        If the answer is not contained in the context, say "I don't know".
+        <context>
+        {context}
+        <context>
+        Questions:{question}
+        """,
+    input_variables=["question","context"]
+)
+
+
+def build_qa_chain(vectorstore, lexical_index):
+    llm = get_llm()
+
+    # BM25 + dense fusion; keyword-style questions skip the embedding call
+    chain =  RetrievalQA.from_chain_type(
+        llm=llm,
+        retriever=HybridRetriever(
+            vector_store=vectorstore, lexical_index=lexical_index),
+        chain_type_kwargs={"prompt": QA_PROMPT},
+        return_source_documents=True,
+    )
+
+    return chain
+
+
+def run_rag_pipeline(doc_path, index_type=INDEX_TYPE):
+    print(" Loading documents and creating embeddings and vectorstore...")
+    vectorstore, chunks = vector_embeddings(
+        load_documents_from_folder(doc_path), index_type)
+
+    lexical_index = build_bm25_index(vectorstore)
+
+    print("|-> RAG system ready. Ask questions (type 'exit' to quit):")
+    qa_chain = build_qa_chain(vectorstore, lexical_index)
+
+    # Repeated and near-duplicate questions are answered from the cache; the
+    # version ties cached answers to this exact set of chunks
+    answer_cache = SemanticAnswerCache()
+    kb_version = hashlib.sha256(
+        "\n".join(chunk.page_content for chunk in chunks).encode("utf-8")).hexdigest()
+
+    while True:
+        user_question = input("\n💬 You: ")
+        if user_question.lower() in ["exit", "quit"]:
+            stats = answer_cache.stats()
+            print(f" Answer cache: {stats['hits']} hits, {stats['misses']} misses")
+            print(" Exiting chat.")
+            break
+
+        # Keyword-style questions go straight to the lexical fast path
+        use_answer_cache = not is_keyword_query(user_question)
+        cached = None
+        if use_answer_cache:
+            question_vector = vectorstore.embedding_function.embed_query(user_question)
+            cached = answer_cache.lookup(kb_version, question_vector)
+        if cached is not None:
+            result, similarity = cached
+            print(f"\n(cached answer, similarity {similarity:.2f})")
+        else:
+            result = qa_chain.invoke({"query": user_question})
+            if use_answer_cache:
+                answer_cache.store(kb_version, question_vector, result)
+
+        print("\n|-> Answer:")
+        print(result['result'])
+
+        print("\n Source Chunks Used:")
+        for i, doc in enumerate(result['source_documents']):
+            source = doc.metadata.get("source", "unknown")
+            if "page" in doc.metadata:
+                source += f", page {doc.metadata['page']}"
+            print(f"\n--- Chunk {i+1} ({source}) ---")
+            print(doc.page_content)
+
+
+
+# Batch mode: questions from a JSONL file, answers streamed to a JSONL file
+BATCH_BLOCK_SIZE = 64
+LLM_CONCURRENCY = 8
+TOP_K = 4
+
+
+def search_many(vectorstore, lexical_index, questions, query_vectors, k=TOP_K):
+    # One FAISS search call for a whole block of questions, each ranking
+    # fused with the question's BM25 ranking
+    dense = dense_search_ids(vectorstore, query_vectors, k * 5)
+    results = []
+    for question, dense_ids in zip(questions, dense):
+        lexical_ids = [doc_id for doc_id, _ in lexical_index.search(question, k * 5)]
+        results.append([vectorstore.docstore.search(doc_id)
+                         for doc_id in fuse_rankings([dense_ids, lexical_ids], k)])
+    return results
+
+
+def read_questions(questions_path):
+    with open(questions_path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if line.strip():
+                record = json.loads(line)
+                yield str(record.get("id", line_number)), record["question"]
+
+
+def drop_partial_line(output_path):
+    # An interrupted run can leave a cut-off last line; the file is cut back
+    # to its last newline so every line stays valid JSON
+    with open(output_path, "rb+") as f:
+        end = position = f.seek(0, os.SEEK_END)
+        while position > 0:
+            step = min(1 << 16, position)
+            position -= step
+            f.seek(position)
+            newline = f.read(step).rfind(b"\n")
+            if newline != -1:
+                position += newline + 1
+                break
+        if position < end:
+            f.truncate(position)
+
+
+def answered_ids(output_path):
+    ids = set()
+    if not os.path.exists(output_path):
+        return ids
+    drop_partial_line(output_path)
+    with open(output_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                ids.add(json.loads(line)["id"])
+    return ids
+
+
+def run_batch_questions(doc_path, questions_path, output_path,
+                        concurrency=LLM_CONCURRENCY, block_size=BATCH_BLOCK_SIZE,
+                        index_type=INDEX_TYPE):
+    print(" Loading documents and creating embeddings and vectorstore...")
+    vectorstore, chunks = vector_embeddings(
+        load_documents_from_folder(doc_path), index_type)
+    embeddings = vectorstore.embedding_function
+    lexical_index = build_bm25_index(vectorstore)
+    llm = get_llm()
+
+    # Resume: questions already in the output file are skipped
+    done = answered_ids(output_path)
+    pending = [(question_id, question)
+               for question_id, question in read_questions(questions_path)
+               if question_id not in done]
+    print(f" {len(done)} already answered, {len(pending)} to go")
+
+    with open(output_path, "a", encoding="utf-8") as out:
+        for i in range(0, len(pending), block_size):
+            block = pending[i:i + block_size]
+
+            start = time.perf_counter()
+            questions = [question for _, question in block]
+            query_vectors = embeddings.embed_queries(questions)
+            docs_per_question = search_many(
+                vectorstore, lexical_index, questions, query_vectors)
+            retrieval_seconds = (time.perf_counter() - start) / len(block)
+
+            prompts = [
+                QA_PROMPT.format(
+                    context="\n\n".join(doc.page_content for doc in docs),
+                    question=question)
+                for (_, question), docs in zip(block, docs_per_question)]
+
+            llm_start = time.perf_counter()
+            # Failed calls are reported and left out, so a rerun retries them
+            for index, answer in llm.batch_as_completed(
+                    prompts, config={"max_concurrency": concurrency},
+                    return_exceptions=True):
+                question_id, question = block[index]
+                if isinstance(answer, Exception):
+                    print(f" [Error] question {question_id}: {answer}")
+                    continue
+                record = {
+                    "id": question_id,
+                    "question": question,
+                    "answer": answer.content,
+                    "sources": [{"content": doc.page_content, **doc.metadata}
+                                for doc in docs_per_question[index]],
+                    "timings": {
+                        "retrieval_s": round(retrieval_seconds, 4),
+                        "llm_s": round(time.perf_counter() - llm_start, 4),
+                    },
+                }
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+
+            print(f" Answered {min(i + block_size, len(pending))}/{len(pending)}")
+
+
+if __name__ == "__main__":
+    folder_path = "knowledge_base"
+
+    parser = argparse.ArgumentParser(description="RAG over the knowledge_base folder")
+    parser.add_argument("--questions", help="JSONL file of {\"id\", \"question\"} "
+                        "records; answers them in batch instead of the chat loop")
+    parser.add_argument("--output", default="answers.jsonl",
+                        help="batch mode: JSONL file answers are appended to")
+    parser.add_argument("--concurrency", type=int, default=LLM_CONCURRENCY,
+                        help="batch mode: LLM calls in flight")
+    parser.add_argument("--index", default=INDEX_TYPE,
+                        choices=["flat", "ivf", "ivfpq", "hnsw"],
+                        help="vector index; approximate ones are for large corpora "
+                        "(search knobs: VECTOR_INDEX_NPROBE, VECTOR_INDEX_EF_SEARCH)")
+    args = parser.parse_args()
+
+    if args.questions:
+        run_batch_questions(folder_path, args.questions, args.output,
+                            concurrency=args.concurrency, index_type=args.index)
+    else:
+        run_rag_pipeline(folder_path, args.index)
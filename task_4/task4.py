@@ -1,105 +1,396 @@
-
-import fitz
-from langchain.prompts import PromptTemplate
-from langchain_groq import ChatGroq
-import os
-from dotenv import load_dotenv
-from langchain_community.document_loaders import PyPDFLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.chains.summarize import load_summarize_chain
-
-load_dotenv()
-
-groq_api_key = os.getenv("GROQ_API_KEY")
-
-llm = ChatGroq(
-    groq_api_key=groq_api_key,
-    model_name="Llama3-8b-8192",
-    temperature=0.2,
-)
-
-
-
-def load_pdf(file_path):
-    doc = fitz.open(file_path)
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    return text
-
-# Function to split text into manageable chunks
-
-
-def split_text(text, chunk_size=900, chunk_overlap=100):
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        separators=["\n\n", "\n", " ", ""]
-    )
-    return splitter.create_documents([text])
-
-
-
-map_prompt_template = """Summarize the following text concisely:
-{text}
-CONCISE SUMMARY:"""
-
-combine_prompt_template = """Combine the following summaries into a comprehensive summary:
-{text}
-COMPREHENSIVE SUMMARY:"""
-
-MAP_PROMPT = PromptTemplate(
-    template=map_prompt_template, input_variables=["text"])
-COMBINE_PROMPT = PromptTemplate(
-    template=combine_prompt_template, input_variables=["text"])
-
-
-
-def summarize_document(file_path):
-    print("Loading document...")
-    text = load_pdf(file_path)
-
-    print("Splitting document into chunks...")
-    docs = split_text(text)
-
-    print("Performing extractive summarization...")
-    extractive_chain = load_summarize_chain(
-        llm,
-        chain_type="map_reduce",
-        map_prompt=MAP_PROMPT,
-        combine_prompt=COMBINE_PROMPT,
-        verbose=True
-    )
-    extractive_summary = extractive_chain.run(docs)
-
-    print("Performing abstractive summarization...")
-    abstractive_chain = load_summarize_chain(
-        llm,
-        chain_type="map_reduce",
-        map_prompt=MAP_PROMPT,
-        combine_prompt=COMBINE_PROMPT,
-        verbose=True
-    )
-    abstractive_summary = abstractive_chain.run(docs)
-
-    # Save summaries to files
-    with open("summary_output.txt", "w", encoding="utf-8") as f:
-        f.write("=== Extractive Summary ===\n\n")
-        f.write(extractive_summary + "\n\n")
-        f.write("=== Abstractive Summary ===\n\n")
-        f.write(abstractive_summary)
-
-    with open("summary_output.md", "w", encoding="utf-8") as f:
-        f.write("# =>Document Summary\n\n")
-        f.write("## |-> Extractive Summary\n\n")
-        f.write(extractive_summary + "\n\n")
-        f.write("## |-> Abstractive Summary\n\n")
-        f.write(abstractive_summary)
-
-    print("Summaries saved to 'summary_output.txt' and 'summary_output.md'.")
-
-
-
-if __name__ == "__main__":
-    file_path = input("Enter your file path: ")
-    summarize_document(file_path)
+import fitz
+import re
+import sys
+import time
+import sqlite3
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import numpy as np
+from langchain.prompts import PromptTemplate
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.documents import Document
+from langchain_groq import ChatGroq
+import os
+from dotenv import load_dotenv
+from langchain_community.document_loaders import PyPDFLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+load_dotenv()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.rate_limit import TokenBucket
+from common.instrumentation import TRACE_CALLBACKS, count, span, traced
+
+groq_api_key = os.getenv("GROQ_API_KEY")
+
+# Llama3-8b-8192: 8192 tokens of context shared by prompt and summary
+MODEL_CONTEXT_TOKENS = 8192
+SUMMARY_MAX_TOKENS = 512
+# Rough token estimate; no tokenizer for the model ships with LangChain
+CHARS_PER_TOKEN = 4
+# Head room for the estimate being off
+CONTEXT_SAFETY = 0.8
+MAX_CONCURRENCY = int(os.getenv("SUMMARY_MAX_CONCURRENCY", "4"))
+TOKENS_PER_MINUTE = int(os.getenv("SUMMARY_TOKENS_PER_MINUTE", "30000"))
+# Map and combine results, so reruns only pay for chunks that changed
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SUMMARY_CACHE_PATH = os.getenv(
+    "SUMMARY_CACHE_PATH", os.path.join(REPO_ROOT, ".cache", "summaries.sqlite"))
+# Average pages per map chunk and summaries per combine group; see
+# content_defined_groups
+PAGES_PER_GROUP = 4
+SUMMARIES_PER_GROUP = 8
+
+llm = ChatGroq(
+    groq_api_key=groq_api_key,
+    model_name="Llama3-8b-8192",
+    temperature=0.2,
+    max_tokens=SUMMARY_MAX_TOKENS,
+    callbacks=TRACE_CALLBACKS,
+)
+
+
+
+def load_pdf_pages(file_path):
+    with span("pdf.load", file=os.path.basename(file_path)) as attrs, \
+            fitz.open(file_path) as doc:
+        attrs["pages"] = doc.page_count
+        return [page.get_text() for page in doc]
+
+
+def load_pdf(file_path):
+    return "".join(load_pdf_pages(file_path))
+
+# Function to split text into manageable chunks
+
+
+def split_text(text, chunk_size=900, chunk_overlap=100):
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n\n", "\n", " ", ""]
+    )
+    return splitter.create_documents([text])
+
+
+
+map_prompt_template = """Summarize the following text concisely:
+{text}
+CONCISE SUMMARY:"""
+
+combine_prompt_template = """Combine the following summaries into a comprehensive summary:
+{text}
+COMPREHENSIVE SUMMARY:"""
+
+MAP_PROMPT = PromptTemplate(
+    template=map_prompt_template, input_variables=["text"])
+COMBINE_PROMPT = PromptTemplate(
+    template=combine_prompt_template, input_variables=["text"])
+
+
+# Extractive summarization: sentences ranked by TextRank over a TF-IDF
+# cosine-similarity graph, no LLM involved
+EXTRACTIVE_SENTENCES = 10
+MIN_SENTENCE_WORDS = 6
+MAX_SENTENCE_WORDS = 60
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_ITERATIONS = 50
+
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])")
+WORD = re.compile(r"[a-z0-9]+")
+
+
+def split_sentences(text):
+    # Split the whole text rather than the chunks, whose edges cut sentences
+    # in half; very long "sentences" are usually tables or run-together lines
+    sentences, seen = [], set()
+    for sentence in SENTENCE_END.split(text):
+        sentence = " ".join(sentence.split())
+        words = len(sentence.split())
+        if MIN_SENTENCE_WORDS <= words <= MAX_SENTENCE_WORDS and sentence not in seen:
+            seen.add(sentence)
+            sentences.append(sentence)
+    return sentences
+
+
+def tfidf_matrix(sentences):
+    # Sparse (row, column, value) triplets of the L2-normalised TF-IDF matrix
+    vocabulary, rows, cols = {}, [], []
+    for row, sentence in enumerate(sentences):
+        for word in WORD.findall(sentence.lower()):
+            rows.append(row)
+            cols.append(vocabulary.setdefault(word, len(vocabulary)))
+    rows, cols = np.array(rows, dtype=np.int64), np.array(cols, dtype=np.int64)
+
+    # Merge repeated (sentence, word) pairs into term counts
+    pair_ids, counts = np.unique(rows * len(vocabulary) + cols, return_counts=True)
+    rows, cols = pair_ids // len(vocabulary), pair_ids % len(vocabulary)
+    document_frequency = np.bincount(cols, minlength=len(vocabulary))
+    idf = np.log((1 + len(sentences)) / (1 + document_frequency)) + 1
+    values = counts * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights=values ** 2, minlength=len(sentences)))
+    return rows, cols, values / norms[rows], len(vocabulary)
+
+
+def textrank_scores(sentences):
+    # Power iteration on the row-normalised similarity graph S = X X^T (minus
+    # self-loops), computed as X (X^T p) so S is never materialised
+    rows, cols, values, vocabulary_size = tfidf_matrix(sentences)
+    count = len(sentences)
+
+    def similarity_times(vector):
+        word_weights = np.bincount(cols, weights=values * vector[rows],
+                                   minlength=vocabulary_size)
+        return np.bincount(rows, weights=values * word_weights[cols],
+                           minlength=count) - vector
+
+    degree = similarity_times(np.ones(count))
+    degree[degree <= 0] = 1.0
+    scores = np.full(count, 1.0 / count)
+    for _ in range(TEXTRANK_ITERATIONS):
+        scores = (1 - TEXTRANK_DAMPING) / count + \
+            TEXTRANK_DAMPING * similarity_times(scores / degree)
+    return scores
+
+
+@traced("summary.extractive")
+def extractive_summary(text, sentence_count=EXTRACTIVE_SENTENCES):
+    sentences = split_sentences(text)
+    if len(sentences) <= sentence_count:
+        return " ".join(sentences)
+    best = np.argsort(-textrank_scores(sentences), kind="stable")[:sentence_count]
+    # Keep the document's order so the summary reads naturally
+    return " ".join(sentences[i] for i in sorted(best))
+
+
+class UsageTracker(BaseCallbackHandler):
+    """Counts LLM calls and the tokens they used."""
+
+    def __init__(self):
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cache_hits = 0
+        self.lock = threading.Lock()
+
+    def on_llm_end(self, response, **kwargs):
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += usage.get("prompt_tokens", 0)
+            self.completion_tokens += usage.get("completion_tokens", 0)
+
+    def report(self):
+        return (f"LLM calls: {self.calls}, tokens: "
+                f"{self.prompt_tokens + self.completion_tokens} "
+                f"({self.prompt_tokens} prompt + {self.completion_tokens} completion), "
+                f"cached results: {self.cache_hits}")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def input_token_budget(prompt):
+    # Tokens of text that fit in one call next to the prompt and the summary
+    return int((MODEL_CONTEXT_TOKENS - SUMMARY_MAX_TOKENS
+                - estimate_tokens(prompt.template)) * CONTEXT_SAFETY)
+
+
+def map_chunk_size():
+    # Characters per map chunk: as large as the model's context allows, so a
+    # document needs as few map calls as possible
+    return input_token_budget(MAP_PROMPT) * CHARS_PER_TOKEN
+
+
+def content_defined_groups(texts, token_budget, every=None):
+    # Consecutive texts grouped to fit token_budget. With `every`, a group
+    # also ends after any text whose hash is divisible by it, so editing one
+    # text only regroups its neighbourhood instead of shifting every later
+    # group (and invalidating their cached summaries)
+    groups, group, group_tokens = [], [], 0
+    for text in texts:
+        tokens = estimate_tokens(text)
+        if group and group_tokens + tokens > token_budget:
+            groups.append(group)
+            group, group_tokens = [], 0
+        group.append(text)
+        group_tokens += tokens
+        if every and int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16) % every == 0:
+            groups.append(group)
+            group, group_tokens = [], 0
+    if group:
+        groups.append(group)
+    return groups
+
+
+def split_pages(pages, every=PAGES_PER_GROUP):
+    # Map chunks made of whole pages (long pages split first), with
+    # content-defined boundaries so unchanged pages keep their chunks. The
+    # pieces of a long page are joined back together in the groups, so they
+    # are split without overlap: overlapping text would be summarized twice
+    chunk_size = map_chunk_size()
+    with span("chunking", pages=len(pages)) as attrs:
+        units = [doc.page_content for page in pages if page.strip()
+                 for doc in split_text(page, chunk_size=chunk_size, chunk_overlap=0)]
+        docs = [Document(page_content="".join(group))
+                for group in content_defined_groups(
+                    units, input_token_budget(MAP_PROMPT), every)]
+        attrs["chunks"] = len(docs)
+    return docs
+
+
+class SummaryCache:
+    """SQLite store of LLM results keyed by model, output limit and prompt."""
+
+    def __init__(self, model_name, path=SUMMARY_CACHE_PATH):
+        self.model_name = model_name
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("""
+        CREATE TABLE IF NOT EXISTS summaries (
+            key TEXT PRIMARY KEY, summary TEXT, created REAL)""")
+
+    def cache_key(self, message):
+        return hashlib.sha256(
+            f"{self.model_name}\n{SUMMARY_MAX_TOKENS}\n{message}".encode("utf-8")
+        ).hexdigest()
+
+    def get(self, message):
+        with self.lock:
+            row = self.conn.execute("SELECT summary FROM summaries WHERE key = ?",
+                                    (self.cache_key(message),)).fetchone()
+        return row[0] if row else None
+
+    def put(self, message, summary):
+        # Committed per result, so an interrupted run keeps what it finished
+        with self.lock:
+            self.conn.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?)",
+                              (self.cache_key(message), summary, time.time()))
+            self.conn.commit()
+
+
+class MapReduceSummarizer:
+    """Map-reduce summarization with concurrent calls under a token budget.
+
+    Map calls run max_concurrency at a time, each one first taking its
+    estimated tokens from a tokens_per_minute bucket. Summaries are combined
+    in levels of groups that fit the context window, until one is left.
+    With a cache, every map and combine result is memoized by its prompt.
+    """
+
+    def __init__(self, llm, max_concurrency=MAX_CONCURRENCY,
+                 tokens_per_minute=TOKENS_PER_MINUTE, max_retries=5, cache=None):
+        self.llm = llm.with_retry(stop_after_attempt=max_retries)
+        self.max_concurrency = max_concurrency
+        self.bucket = TokenBucket(tokens_per_minute / 60, capacity=tokens_per_minute)
+        self.cache = cache
+
+    def call(self, prompt, text, tracker):
+        message = prompt.format(text=text)
+        if self.cache is not None:
+            summary = self.cache.get(message)
+            if summary is not None:
+                with tracker.lock:
+                    tracker.cache_hits += 1
+                count("summary.cache_hits")
+                return summary
+
+        self.bucket.acquire(min(self.bucket.capacity,
+                                estimate_tokens(message) + SUMMARY_MAX_TOKENS))
+        summary = self.llm.invoke(message, config={"callbacks": [tracker]}).content
+        if self.cache is not None:
+            self.cache.put(message, summary)
+        return summary
+
+    def run_all(self, prompt, texts, tracker, label):
+        # Results in input order; progress printed as calls finish
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as pool:
+            futures = [pool.submit(self.call, prompt, text, tracker) for text in texts]
+            for done, _ in enumerate(as_completed(futures), 1):
+                print(f"{label}: {done}/{len(texts)}")
+            return [future.result() for future in futures]
+
+    def summarize(self, docs, tracker):
+        with span("summary.map", chunks=len(docs)):
+            summaries = self.run_all(MAP_PROMPT, [doc.page_content for doc in docs],
+                                     tracker, "Map")
+        token_budget = input_token_budget(COMBINE_PROMPT)
+        level = 1
+        while len(summaries) > 1:
+            groups = content_defined_groups(summaries, token_budget, SUMMARIES_PER_GROUP)
+            if len(groups) == len(summaries):
+                # Every summary ended a group; pack greedily to make progress
+                groups = content_defined_groups(summaries, token_budget)
+            # A group of one is carried to the next level as it is
+            with span("summary.combine", level=level, groups=len(groups)):
+                combined = iter(self.run_all(
+                    COMBINE_PROMPT,
+                    ["\n\n".join(group) for group in groups if len(group) > 1],
+                    tracker, f"Combine level {level}"))
+            summaries = [next(combined) if len(group) > 1 else group[0]
+                         for group in groups]
+            level += 1
+        return summaries[0] if summaries else ""
+
+
+def abstractive_summary(docs, tracker, use_cache=True):
+    cache = SummaryCache(llm.model_name) if use_cache else None
+    return MapReduceSummarizer(llm, cache=cache).summarize(docs, tracker)
+
+
+def summarize_document(file_path, mode="both", use_cache=True):
+    print("Loading document...")
+    pages = load_pdf_pages(file_path)
+    text = "".join(pages)
+
+    print("Splitting document into chunks...")
+    docs = split_pages(pages)
+
+    # (title, summary, usage) per mode that was run
+    summaries = []
+    if mode in ("both", "extractive"):
+        print("Performing extractive summarization...")
+        summaries.append(("Extractive Summary", extractive_summary(text),
+                          UsageTracker().report()))
+
+    if mode in ("both", "abstractive"):
+        print("Performing abstractive summarization...")
+        tracker = UsageTracker()
+        summaries.append(("Abstractive Summary",
+                          abstractive_summary(docs, tracker, use_cache),
+                          tracker.report()))
+
+    # Save summaries to files
+    with open("summary_output.txt", "w", encoding="utf-8") as f:
+        for title, summary, usage in summaries:
+            f.write(f"=== {title} ===\n\n")
+            f.write(summary + "\n\n")
+            f.write(f"[{usage}]\n\n")
+
+    with open("summary_output.md", "w", encoding="utf-8") as f:
+        f.write("# =>Document Summary\n\n")
+        for title, summary, usage in summaries:
+            f.write(f"## |-> {title}\n\n")
+            f.write(summary + "\n\n")
+            f.write(f"_{usage}_\n\n")
+
+    for title, _, usage in summaries:
+        print(f"{title}: {usage}")
+    print("Summaries saved to 'summary_output.txt' and 'summary_output.md'.")
+
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize a PDF")
+    parser.add_argument("file_path", nargs="?", help="PDF to summarize")
+    parser.add_argument("--mode", default="both",
+                        choices=["both", "extractive", "abstractive"],
+                        help="extractive needs no LLM calls")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="re-summarize every chunk instead of reusing cached results")
+    args = parser.parse_args()
+    file_path = args.file_path or input("Enter your file path: ")
+    summarize_document(file_path, args.mode, use_cache=not args.no_cache)
@@ -0,0 +1,146 @@
+# Persistent cache of search responses and extracted article text for the
+# research agent, with HTTP revalidation and an offline replay mode
+import os
+import re
+import sys
+import time
+import sqlite3
+import hashlib
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.sqlite_cache import evict_lru
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CACHE_PATH = os.getenv(
+    "HTTP_CACHE_PATH", os.path.join(REPO_ROOT, ".cache", "http.sqlite"))
+CACHE_MAX_BYTES = int(os.getenv("HTTP_CACHE_MAX_MB", "256")) * 1024 * 1024
+# Search results go stale faster than article text
+SEARCH_TTL_SECONDS = float(os.getenv("SEARCH_CACHE_TTL", str(6 * 3600)))
+ARTICLE_TTL_SECONDS = float(os.getenv("ARTICLE_CACHE_TTL", str(7 * 24 * 3600)))
+# Serve everything from the cache and never touch the network
+OFFLINE = os.getenv("HTTP_CACHE_OFFLINE", "0") == "1"
+
+QUERY_WORD = re.compile(r"\w+")
+
+
+def normalize_query(query):
+    # "Tata Motors  market share?" and "tata motors market share" share an entry
+    return " ".join(QUERY_WORD.findall(query.lower()))
+
+
+class CacheEntry:
+    """A cached body with its HTTP validators and age."""
+
+    def __init__(self, body, etag, last_modified, stored, ttl_seconds):
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored = stored
+        self.ttl_seconds = ttl_seconds
+
+    @property
+    def fresh(self):
+        return time.time() - self.stored < self.ttl_seconds
+
+    def revalidation_headers(self):
+        headers = {}
+        if self.etag:
+            headers["If-None-Match"] = self.etag
+        if self.last_modified:
+            headers["If-Modified-Since"] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    """SQLite store keyed by kind (search/article) and a SHA-256 of the request.
+
+    Fresh entries are served directly; stale ones keep their ETag and
+    Last-Modified so the caller can revalidate them with a conditional
+    request, and are counted as revalidated rather than as hits. The total
+    size is kept as a running count, and once it is over max_bytes the least
+    recently used entries are evicted.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_bytes=CACHE_MAX_BYTES,
+                 search_ttl_seconds=SEARCH_TTL_SECONDS,
+                 article_ttl_seconds=ARTICLE_TTL_SECONDS, offline=OFFLINE):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = {"search": search_ttl_seconds,
+                            "article": article_ttl_seconds}
+        self.offline = offline
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript("""
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY, kind TEXT, body TEXT, etag TEXT,
+            last_modified TEXT, stored REAL, last_used REAL, size INTEGER);
+        CREATE INDEX IF NOT EXISTS idx_responses_last_used
+            ON responses (last_used);
+        """)
+        self.size = self.conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def cache_key(self, kind, request):
+        return hashlib.sha256(f"{kind}\n{request}".encode("utf-8")).hexdigest()
+
+    def get(self, kind, request):
+        key = self.cache_key(kind, request)
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT body, etag, last_modified, stored FROM responses WHERE key = ?",
+                (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            entry = CacheEntry(*row, self.ttl_seconds[kind])
+            # Offline, a stale entry is served as it is
+            if entry.fresh or self.offline:
+                self.hits += 1
+            else:
+                self.revalidated += 1
+            self.conn.execute("UPDATE responses SET last_used = ? WHERE key = ?",
+                              (time.time(), key))
+            self.conn.commit()
+        return entry
+
+    def put(self, kind, request, body, etag=None, last_modified=None):
+        now = time.time()
+        key = self.cache_key(kind, request)
+        size = len(body.encode("utf-8"))
+        with self.lock:
+            replaced = self.conn.execute(
+                "SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.conn.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, body, etag, last_modified, now, now, size))
+            self.conn.commit()
+            self.size += size - (replaced[0] if replaced else 0)
+            if self.size > self.max_bytes:
+                self.size -= evict_lru(self.conn, "responses", "size",
+                                       self.max_bytes, total=self.size)
+
+    def refresh(self, kind, request):
+        # A 304 answer: the stored body is good for another TTL
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "UPDATE responses SET stored = ?, last_used = ? WHERE key = ?",
+                (now, now, self.cache_key(kind, request)))
+            self.conn.commit()
+
+    def evict(self):
+        with self.lock:
+            self.size -= evict_lru(self.conn, "responses", "size",
+                                   self.max_bytes, total=self.size)
+
+    def stats(self):
+        total = self.hits + self.revalidated + self.misses
+        return {"hits": self.hits, "revalidated": self.revalidated,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0}
@@ -0,0 +1,88 @@
+# Runs items through a chain of stages, each stage on its own worker threads
+# and fed by a bounded queue, so different items are in different stages at
+# the same time
+import os
+import sys
+import time
+import queue
+import threading
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.instrumentation import span
+
+STOP = object()
+QUEUE_SIZE = 2
+
+
+class Stage:
+    """A named step; `work(item)` gets the item's result dict and updates it."""
+
+    def __init__(self, name, work, workers=1):
+        self.name = name
+        self.work = work
+        self.workers = workers
+
+
+def run_stage(stage, inbox, outbox, downstream_workers, remaining, lock, on_done):
+    while True:
+        item = inbox.get()
+        if item is STOP:
+            break
+        if item.get("error") is None:
+            start = time.perf_counter()
+            try:
+                with span(f"stage.{stage.name}"):
+                    stage.work(item)
+            except Exception as e:
+                item["error"] = f"{stage.name}: {e}"
+            item["timings"][stage.name] = time.perf_counter() - start
+        if outbox is None:
+            on_done(item)
+        else:
+            outbox.put(item)
+
+    # The last worker of a stage to finish stops the next stage
+    with lock:
+        remaining[stage.name] -= 1
+        last = remaining[stage.name] == 0
+    if last and outbox is not None:
+        for _ in range(downstream_workers):
+            outbox.put(STOP)
+
+
+def run_pipeline(items, stages, queue_size=QUEUE_SIZE, on_done=None):
+    # items: dicts passed from stage to stage. A failing stage records
+    # item["error"] and later stages skip the item. Returns the items in
+    # completion order, each with per-stage seconds in item["timings"]
+    finished = []
+
+    def done(item):
+        finished.append(item)
+        if on_done is not None:
+            on_done(item)
+
+    queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+    remaining = {stage.name: stage.workers for stage in stages}
+    lock = threading.Lock()
+    threads = []
+    for i, stage in enumerate(stages):
+        outbox = queues[i + 1] if i + 1 < len(stages) else None
+        downstream_workers = stages[i + 1].workers if outbox is not None else 0
+        for _ in range(stage.workers):
+            thread = threading.Thread(
+                target=run_stage,
+                args=(stage, queues[i], outbox, downstream_workers, remaining, lock, done),
+                daemon=True)
+            thread.start()
+            threads.append(thread)
+
+    # The first queue is bounded too, so this blocks while the pipeline is full
+    for item in items:
+        item.setdefault("timings", {})
+        item.setdefault("error", None)
+        queues[0].put(item)
+    for _ in range(stages[0].workers):
+        queues[0].put(STOP)
+    for thread in threads:
+        thread.join()
+    return finished
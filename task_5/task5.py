@@ -1,236 +1,360 @@
-from langchain_groq import ChatGroq
-from langchain.prompts import PromptTemplate
-from langchain.agents import create_openai_tools_agent, AgentExecutor
-from langchain.tools import Tool, StructuredTool, tool
-from langchain_core.runnables import RunnableSequence
-import os
-from dotenv import load_dotenv
-from langchain.chains import LLMChain
-import requests
-from bs4 import BeautifulSoup
-
-load_dotenv()
-
-groq_api_key = os.getenv("GROQ_API_KEY")
-SERPER_API_KEY = os.getenv("SERPER_API_KEY")
-
-llm = ChatGroq(
-    groq_api_key=groq_api_key,
-    model_name="Llama3-8b-8192",
-    temperature=0.2,
-)
-
-# Agent1-Define the Research Agent Prompt
-research_prompt = PromptTemplate(
-    input_variables=["input", "agent_scratchpad"],
-    template="""
-    You are a highly skilled Market Research Specialist tasked with gathering accurate, up-to-date insights about "{input}" and its industry.
-
-You have access to external tools such as:
-search_and_fetch_articles : for real time web searches
-Calculator: for numerical estimates
-
-Important Instructions:
-Use tools whenever necessary — especially when recent or factual information is needed.
-Do NOT guess or hallucinate facts.
--Always cite the source if applicable.
-
-Your research should include the following sections:
-
-1. Company Overview and History 
-    Use the Search Tool to find a brief company background.
-
-2.  Market Size and Growth Estimates
-    Use Search Tool or Article Fetcher to get recent stats or reports.
-
-3. Top 3 Competitors and Market Shares
-    Search for competitor analysis reports or summaries.
-
-4. Current Industry Trends
-   Fetch recent articles and summarize 2–3 trends shaping the industry.
-
-5. ain Product/Service Offerings 
-   → Identify key products/services listed on official websites or reliable sources.
-
-6. Recent News or Developments (last 6 months)
-   → Use the Search Tool to find recent news or press releases.
-
-
-
-Respond with a structured report. Use tools as needed before answering each section. Write intermediate thoughts and actions in the scratchpad below to help guide your tool usage:
-
-{agent_scratchpad}
-"""
-)
-
-# Agent 2 - Define the Analysis Agent Prompt
-analysis_prompt = PromptTemplate(
-    input_variables=["input", "agent_scratchpad"],
-    template="""
-You are a professional Business Analyst tasked with interpreting structured market research data.
-
-Analyze the following market research content:
-
-{input}
-
-
-You have access to the following tool(s):
-    calculator_tool: Use this only for valid numerical expressions (e.g., 100 * 5 + 2). Do not use for text-based or non-numerical input.
-
-{agent_scratchpad}
-"""
-)
-
-# Agent 3 - Prompt
-report_prompt = PromptTemplate(
-    input_variables=["input","topic"],
-    template="""
-    You are a Professional Report Writer specializing in market research reports.
-
-    Based on the following analysis:
-    {input}
-
-    Create a concise market research report on {topic} with these sections:
-
-    1. Executive Summary (brief)
-    2. Table of Contents (optional)
-    3. Company Overview (short)
-    4. Industry Analysis (summarized)
-    5. Competitive Landscape (top competitors)
-    6. SWOT Analysis (concise)
-    7. Growth Opportunities (key opportunities)
-    8. Strategic Recommendations (2-3 recommendations)
-    9. Conclusion (brief)
-
-    Format the report in professional Markdown with appropriate headers and bullet points. Keep the report under 1000 tokens.
-    """
-)
-
-
-@tool
-def search_and_fetch_articles(query: str) -> str:
-    """
-    Searches Google using Serper API and fetches key article content.
-    Returns a merged result from 1 top-ranked article.
-    """
-
-    url = "https://google.serper.dev/search"
-    headers = {"X-API-KEY": SERPER_API_KEY, "Content-Type": "application/json"}
-    payload = {"q": query}
-
-    try:
-        response = requests.post(url, headers=headers,
-                                 json=payload, timeout=10)
-        response.raise_for_status()
-        data = response.json()
-
-        articles = []
-        for item in data.get("organic", [])[:1]:  # Only 1 article for performance
-            article_url = item.get("link", "")
-            content = fetch_article_content(article_url)
-            articles.append({"url": article_url, "content": content})
-
-        return concatenate_article_text(articles)
-
-    except Exception as e:
-        return f"[Error searching articles]: {str(e)}"
-
-
-def fetch_article_content(url: str) -> str:
-    try:
-        res = requests.get(url, timeout=10)
-        res.raise_for_status()
-        soup = BeautifulSoup(res.content, "html.parser")
-
-        paragraphs = soup.find_all('p')
-        content = " ".join([p.get_text(strip=True)
-                           for p in paragraphs[:3]])  # fewer paragraphs
-        return content[:1000]  # limit to 1000 characters
-    except Exception as e:
-        return f"[Error fetching content from {url}]: {str(e)}"
-
-
-
-def concatenate_article_text(articles: list) -> str:
-    all_text = ""
-    for i, article in enumerate(articles, 1):
-        all_text += f"\n🔗 Article {i}: {article['url']}\n"
-        all_text += article['content'] + "\n\n"
-    return all_text.strip()
-
-
-@tool
-def calculator_tool(expression: str) -> str:
-    """Evaluate a simple math expression using Python eval"""
-    try:
-        return str(eval(expression))
-    except Exception as e:
-        return f"Math error: {e}"
-
-## Defining Agent1
-tools = [search_and_fetch_articles,calculator_tool]
-# Create the agent
-agent1 = create_openai_tools_agent(llm, tools, research_prompt)
-agent_executor1 = AgentExecutor(
-    agent=agent1,
-    tools=tools,
-    verbose=True,
-    handle_parsing_errors=True,
-    max_iterations=5
-)
-
-
-def run_agent1(query):
-    return agent_executor1.invoke({"input": query})["output"]
-
-
-## Agent 2 - Analysis chain
-agent2_tools = [calculator_tool]
-agent2 = create_openai_tools_agent(llm, agent2_tools, analysis_prompt)
-agent_executor2 = AgentExecutor(
-    agent=agent2,tools=agent2_tools,verbose=True, max_iterations=5)
-
-
-def run_agent2(research_data):
-    research_data = research_data[:12000] # to stay within token limit
-    result = agent_executor2.invoke({"input": research_data})
-    return result["output"] if isinstance(result, dict) else result
-
-
-# Agent 3
-report_chain = report_prompt|llm
-
-def run_agent3(analysis_results,topic):
-    result = report_chain.invoke({"input": analysis_results,"topic":topic})
-    return result.content
-
-
-
-# worflow 
-def run_full_workflow(topic):
-    print(f"\n |-> Running Market Research Workflow for: {topic}")
-
-    print("\n Agent 1: Researching...")
-    research_data = run_agent1(f"Market research report on {topic}")
-
-    print("\n Agent 2: Analyzing...")
-    analysis_output = run_agent2(research_data)
-
-    print("\n Agent 3: Writing Report...")
-    final_report = run_agent3(analysis_output,topic)
-
-    with open("market_research_report.md", "w", encoding="utf-8") as f:
-        try:
-            f.write(str(final_report))
-        except Exception as e:
-            print(f"[Error writing file]: {e}")
-
-    print("✅ Report saved as 'market_research_report.md'")
-    return final_report
-
-
-# entry point of execution
-if __name__ == "__main__":
-    run_full_workflow("Tata Motors Limited")
-
+import os
+import re
+import sys
+import json
+import time
+import atexit
+import argparse
+import threading
+from functools import lru_cache, wraps
+from dotenv import load_dotenv
+from langchain_core.rate_limiters import InMemoryRateLimiter
+
+# web_fetch, http_cache and common/ read their settings on import
+load_dotenv()
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from web_fetch import AsyncFetcher, TOP_RESULTS
+from http_cache import HttpCache
+from pipeline import Stage, run_pipeline, QUEUE_SIZE
+from common.instrumentation import TRACE_CALLBACKS
+
+groq_api_key = os.getenv("GROQ_API_KEY")
+SERPER_API_KEY = os.getenv("SERPER_API_KEY")
+
+# One client and one request budget for every agent and every topic
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "30"))
+RATE_LIMITER = InMemoryRateLimiter(
+    requests_per_second=LLM_REQUESTS_PER_MINUTE / 60, check_every_n_seconds=0.1)
+
+# The LangChain agent stack takes over a second to import, so the model,
+# agents, chains and HTTP client are built on first use, once per process.
+# Importing this module (e.g. for fetch_article_content) stays cheap
+BUILD_LOCK = threading.RLock()
+
+
+def build_once(build):
+    # The lock keeps concurrent pipeline workers from building it twice
+    cached = lru_cache(maxsize=None)(build)
+
+    @wraps(build)
+    def get():
+        with BUILD_LOCK:
+            return cached()
+    return get
+
+
+@build_once
+def get_llm():
+    from langchain_groq import ChatGroq
+
+    return ChatGroq(
+        groq_api_key=groq_api_key,
+        model_name="Llama3-8b-8192",
+        temperature=0.2,
+        rate_limiter=RATE_LIMITER,
+        callbacks=TRACE_CALLBACKS,
+    )
+
+
+@build_once
+def get_fetcher():
+    # Pooled keep-alive HTTP client shared by every search tool call; searches
+    # and articles are cached on disk (HTTP_CACHE_OFFLINE=1 replays the cache)
+    fetcher = AsyncFetcher(api_key=SERPER_API_KEY, cache=HttpCache())
+    atexit.register(fetcher.close)
+    return fetcher
+
+# Agent1-Define the Research Agent Prompt
+research_template = """
+    You are a highly skilled Market Research Specialist tasked with gathering accurate, up-to-date insights about "{input}" and its industry.
+
+You have access to external tools such as:
+search_and_fetch_articles : for real time web searches
+Calculator: for numerical estimates
+
+Important Instructions:
+Use tools whenever necessary — especially when recent or factual information is needed.
+Do NOT guess or hallucinate facts.
+-Always cite the source if applicable.
+
+Your research should include the following sections:
+
+1. Company Overview and History 
+    Use the Search Tool to find a brief company background.
+
+2.  Market Size and Growth Estimates
+    Use Search Tool or Article Fetcher to get recent stats or reports.
+
+3. Top 3 Competitors and Market Shares
+    Search for competitor analysis reports or summaries.
+
+4. Current Industry Trends
+   Fetch recent articles and summarize 2–3 trends shaping the industry.
+
+5. ain Product/Service Offerings 
+   → Identify key products/services listed on official websites or reliable sources.
+
+6. Recent News or Developments (last 6 months)
+   → Use the Search Tool to find recent news or press releases.
+
+
+
+Respond with a structured report. Use tools as needed before answering each section. Write intermediate thoughts and actions in the scratchpad below to help guide your tool usage:
+
+{agent_scratchpad}
+"""
+
+# Agent 2 - Define the Analysis Agent Prompt
+analysis_template = """
+You are a professional Business Analyst tasked with interpreting structured market research data.
+
+Analyze the following market research content:
+
+{input}
+
+
+You have access to the following tool(s):
+    calculator_tool: Use this only for valid numerical expressions (e.g., 100 * 5 + 2). Do not use for text-based or non-numerical input.
+
+{agent_scratchpad}
+"""
+
+# Agent 3 - Prompt
+report_template = """
+    You are a Professional Report Writer specializing in market research reports.
+
+    Based on the following analysis:
+    {input}
+
+    Create a concise market research report on {topic} with these sections:
+
+    1. Executive Summary (brief)
+    2. Table of Contents (optional)
+    3. Company Overview (short)
+    4. Industry Analysis (summarized)
+    5. Competitive Landscape (top competitors)
+    6. SWOT Analysis (concise)
+    7. Growth Opportunities (key opportunities)
+    8. Strategic Recommendations (2-3 recommendations)
+    9. Conclusion (brief)
+
+    Format the report in professional Markdown with appropriate headers and bullet points. Keep the report under 1000 tokens.
+    """
+
+
+# Plain functions, wrapped as LangChain tools when the agents are built
+def search_and_fetch_articles(query: str) -> str:
+    """
+    Searches Google using Serper API and fetches key article content.
+    Returns a merged result from the top-ranked articles, fetched concurrently.
+    """
+
+    try:
+        articles = get_fetcher().search_and_fetch(query, TOP_RESULTS)
+        return concatenate_article_text(articles)
+
+    except Exception as e:
+        return f"[Error searching articles]: {str(e)}"
+
+
+def fetch_article_content(url: str) -> str:
+    # First paragraphs of the page, read with a streaming parser
+    return get_fetcher().fetch_article(url)
+
+
+
+def concatenate_article_text(articles: list) -> str:
+    all_text = ""
+    for i, article in enumerate(articles, 1):
+        all_text += f"\n🔗 Article {i}: {article['url']}\n"
+        all_text += article['content'] + "\n\n"
+    return all_text.strip()
+
+
+def calculator_tool(expression: str) -> str:
+    """Evaluate a simple math expression using Python eval"""
+    try:
+        return str(eval(expression))
+    except Exception as e:
+        return f"Math error: {e}"
+
+## Defining Agent1
+@build_once
+def get_agent_executor1():
+    from langchain.agents import create_openai_tools_agent, AgentExecutor
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.tools import tool
+
+    tools = [tool(search_and_fetch_articles), tool(calculator_tool)]
+    # Create the agent
+    agent1 = create_openai_tools_agent(
+        get_llm(), tools, PromptTemplate.from_template(research_template))
+    return AgentExecutor(
+        agent=agent1,
+        tools=tools,
+        verbose=True,
+        handle_parsing_errors=True,
+        max_iterations=5
+    )
+
+
+def run_agent1(query):
+    # Passed per call so the tool calls are traced too, not just the LLM
+    return get_agent_executor1().invoke(
+        {"input": query}, config={"callbacks": TRACE_CALLBACKS})["output"]
+
+
+## Agent 2 - Analysis chain
+@build_once
+def get_agent_executor2():
+    from langchain.agents import create_openai_tools_agent, AgentExecutor
+    from langchain_core.prompts import PromptTemplate
+    from langchain_core.tools import tool
+
+    agent2_tools = [tool(calculator_tool)]
+    agent2 = create_openai_tools_agent(
+        get_llm(), agent2_tools, PromptTemplate.from_template(analysis_template))
+    return AgentExecutor(
+        agent=agent2,tools=agent2_tools,verbose=True, max_iterations=5)
+
+
+def run_agent2(research_data):
+    research_data = research_data[:12000] # to stay within token limit
+    result = get_agent_executor2().invoke(
+        {"input": research_data}, config={"callbacks": TRACE_CALLBACKS})
+    return result["output"] if isinstance(result, dict) else result
+
+
+# Agent 3
+@build_once
+def get_report_chain():
+    from langchain_core.prompts import PromptTemplate
+
+    return PromptTemplate.from_template(report_template) | get_llm()
+
+def run_agent3(analysis_results,topic):
+    result = get_report_chain().invoke({"input": analysis_results,"topic":topic})
+    return result.content
+
+
+
+# worflow 
+def run_full_workflow(topic):
+    print(f"\n |-> Running Market Research Workflow for: {topic}")
+
+    print("\n Agent 1: Researching...")
+    research_data = run_agent1(f"Market research report on {topic}")
+
+    print("\n Agent 2: Analyzing...")
+    analysis_output = run_agent2(research_data)
+
+    print("\n Agent 3: Writing Report...")
+    final_report = run_agent3(analysis_output,topic)
+
+    with open("market_research_report.md", "w", encoding="utf-8") as f:
+        try:
+            f.write(str(final_report))
+        except Exception as e:
+            print(f"[Error writing file]: {e}")
+
+    print("✅ Report saved as 'market_research_report.md'")
+    return final_report
+
+
+# Batch of topics: research, analysis and report writing run as a pipeline,
+# so research for the next topic overlaps analysis of the current one
+REPORTS_DIR = "reports"
+
+
+def report_path(topic, index):
+    # The topic's position keeps names unique: "Tata Motors" and
+    # "tata-motors" share a slug and may be written at the same time
+    slug = re.sub(r"[^a-z0-9]+", "_", topic.lower()).strip("_") or "report"
+    return os.path.join(REPORTS_DIR, f"{index + 1:03d}_{slug}.md")
+
+
+def research_stage(item):
+    item["research"] = run_agent1(f"Market research report on {item['topic']}")
+
+
+def analysis_stage(item):
+    item["analysis"] = run_agent2(item.pop("research"))
+
+
+def report_stage(item):
+    report = run_agent3(item.pop("analysis"), item["topic"])
+    item["path"] = report_path(item["topic"], item["index"])
+    with open(item["path"], "w", encoding="utf-8") as f:
+        f.write(str(report))
+
+
+def run_batch_workflow(topics, research_workers=1, analysis_workers=1,
+                       report_workers=1, queue_size=QUEUE_SIZE):
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    stages = [
+        Stage("research", research_stage, research_workers),
+        Stage("analysis", analysis_stage, analysis_workers),
+        Stage("report", report_stage, report_workers),
+    ]
+
+    def on_done(item):
+        if item["error"]:
+            print(f"[Error] {item['topic']}: {item['error']}")
+        else:
+            print(f"✅ {item['topic']}: {item['path']}")
+
+    start = time.perf_counter()
+    results = run_pipeline([{"topic": topic, "index": index}
+                            for index, topic in enumerate(topics)], stages,
+                           queue_size=queue_size, on_done=on_done)
+    wall_seconds = time.perf_counter() - start
+
+    # Per-topic stage timings; stage time above wall time is the overlap won
+    timings = {
+        "wall_s": round(wall_seconds, 2),
+        "stage_totals_s": {stage.name: round(sum(item["timings"].get(stage.name, 0)
+                                                 for item in results), 2)
+                           for stage in stages},
+        "topics": [{"topic": item["topic"], "report": item.get("path"),
+                    "error": item["error"],
+                    "timings_s": {name: round(seconds, 2)
+                                  for name, seconds in item["timings"].items()}}
+                   for item in results],
+    }
+    with open(os.path.join(REPORTS_DIR, "timings.json"), "w", encoding="utf-8") as f:
+        json.dump(timings, f, indent=4)
+
+    print(f"\n{len(results)} topics in {wall_seconds:.1f}s; stage totals: " +
+          ", ".join(f"{name} {seconds:.1f}s"
+                    for name, seconds in timings["stage_totals_s"].items()))
+    return results
+
+
+def read_topics(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip()]
+
+
+# entry point of execution
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Market research report generator")
+    parser.add_argument("topics", nargs="*",
+                        help="topics for a batch run, one report each in reports/")
+    parser.add_argument("--topics-file", help="file with one topic per line")
+    parser.add_argument("--research-workers", type=int, default=1)
+    parser.add_argument("--analysis-workers", type=int, default=1)
+    parser.add_argument("--report-workers", type=int, default=1)
+    parser.add_argument("--queue-size", type=int, default=QUEUE_SIZE,
+                        help="topics waiting between two stages")
+    args = parser.parse_args()
+
+    topics = list(args.topics)
+    if args.topics_file:
+        topics += read_topics(args.topics_file)
+    if topics:
+        run_batch_workflow(topics, args.research_workers, args.analysis_workers,
+                           args.report_workers, args.queue_size)
+    else:
+        run_full_workflow("Tata Motors Limited")
+
 # used large language model is llama provided Groq api
\ No newline at end of file
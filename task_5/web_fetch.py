@@ -0,0 +1,195 @@
+# Async search-and-fetch for the research agent: one pooled keep-alive HTTP
+# client on a background event loop, concurrent article downloads with
+# per-host limits and timeouts, and a streaming <p> extractor
+import os
+import sys
+import json
+import codecs
+import asyncio
+import threading
+from html.parser import HTMLParser
+import aiohttp
+
+from http_cache import normalize_query
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from common.instrumentation import span
+
+SERPER_URL = os.getenv("SERPER_URL", "https://google.serper.dev/search")
+# Articles fetched per search, and how much of each is kept
+TOP_RESULTS = int(os.getenv("SEARCH_TOP_RESULTS", "3"))
+MAX_PARAGRAPHS = 3
+MAX_ARTICLE_CHARS = 1000
+# Connection pool: total and per-host connections, and timeouts in seconds
+MAX_CONNECTIONS = 32
+MAX_CONNECTIONS_PER_HOST = 4
+CONNECT_TIMEOUT = 5
+REQUEST_TIMEOUT = 10
+# Stop downloading a page after this much HTML even without enough <p>s
+MAX_HTML_BYTES = 2 * 1024 * 1024
+READ_CHUNK_BYTES = 16 * 1024
+
+
+class ParagraphExtractor(HTMLParser):
+    """Collects the text of the first max_paragraphs <p> elements.
+
+    Fed incrementally, so the download can stop as soon as it is done.
+    """
+
+    def __init__(self, max_paragraphs=MAX_PARAGRAPHS):
+        super().__init__(convert_charrefs=True)
+        self.max_paragraphs = max_paragraphs
+        self.paragraphs = []
+        self.current = None
+        self.skip_depth = 0
+
+    @property
+    def done(self):
+        return len(self.paragraphs) >= self.max_paragraphs
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ("script", "style"):
+            self.skip_depth += 1
+        elif tag == "p":
+            self.end_paragraph()
+            self.current = []
+
+    def handle_endtag(self, tag):
+        if tag in ("script", "style"):
+            self.skip_depth = max(0, self.skip_depth - 1)
+        elif tag == "p":
+            self.end_paragraph()
+
+    def handle_data(self, data):
+        if self.current is not None and not self.skip_depth:
+            self.current.append(data)
+
+    def end_paragraph(self):
+        if self.current is None:
+            return
+        text = " ".join("".join(self.current).split())
+        self.current = None
+        if text and not self.done:
+            self.paragraphs.append(text)
+
+    def text(self):
+        return " ".join(self.paragraphs)
+
+
+async def fetch_article(session, url, max_paragraphs=MAX_PARAGRAPHS,
+                        max_chars=MAX_ARTICLE_CHARS, cache=None):
+    # Cached text is served while fresh (or always, offline); stale entries
+    # are revalidated with If-None-Match / If-Modified-Since
+    request = f"{max_paragraphs}\n{url}"
+    entry = cache.get("article", request) if cache is not None else None
+    if entry is not None and (entry.fresh or cache.offline):
+        return entry.body[:max_chars]
+    if cache is not None and cache.offline:
+        return f"[Offline: no cached content for {url}]"
+
+    headers = entry.revalidation_headers() if entry is not None else {}
+    try:
+        with span("http.article", url=url) as attrs:
+            async with session.get(url, headers=headers) as response:
+                attrs["status"] = response.status
+                if response.status == 304 and entry is not None:
+                    cache.refresh("article", request)
+                    return entry.body[:max_chars]
+                response.raise_for_status()
+                decoder = codecs.getincrementaldecoder(response.charset or "utf-8")(
+                    errors="replace")
+                extractor = ParagraphExtractor(max_paragraphs)
+                read = 0
+                async for chunk in response.content.iter_chunked(READ_CHUNK_BYTES):
+                    extractor.feed(decoder.decode(chunk))
+                    read += len(chunk)
+                    if extractor.done or read >= MAX_HTML_BYTES:
+                        break
+                extractor.end_paragraph()
+                text = extractor.text()
+                if cache is not None:
+                    cache.put("article", request, text,
+                              etag=response.headers.get("ETag"),
+                              last_modified=response.headers.get("Last-Modified"))
+                return text[:max_chars]
+    except Exception as e:
+        return f"[Error fetching content from {url}]: {str(e)}"
+
+
+async def search(session, query, api_key, search_url=SERPER_URL, cache=None):
+    # Search responses carry no validators, so they are cached by TTL only,
+    # under the normalized query so near-identical queries share a result
+    request = f"{search_url}\n{normalize_query(query)}"
+    entry = cache.get("search", request) if cache is not None else None
+    if entry is not None and (entry.fresh or cache.offline):
+        return json.loads(entry.body)
+    if cache is not None and cache.offline:
+        raise LookupError(f"Offline: no cached search results for {query!r}")
+
+    headers = {"X-API-KEY": api_key or "", "Content-Type": "application/json"}
+    with span("http.search", query=query):
+        async with session.post(search_url, headers=headers, json={"q": query}) as response:
+            response.raise_for_status()
+            data = await response.json()
+    if cache is not None:
+        cache.put("search", request, json.dumps(data))
+    return data
+
+
+async def search_and_fetch(session, query, api_key, top_n=TOP_RESULTS,
+                           search_url=SERPER_URL, cache=None):
+    # Top results are downloaded concurrently; returns [{"url", "content"}]
+    data = await search(session, query, api_key, search_url, cache)
+    urls = [item.get("link", "") for item in data.get("organic", [])[:top_n]]
+    contents = await asyncio.gather(
+        *(fetch_article(session, url, cache=cache) for url in urls))
+    return [{"url": url, "content": content} for url, content in zip(urls, contents)]
+
+
+class AsyncFetcher:
+    """Runs the async fetch layer for synchronous callers (agent tools).
+
+    A background thread owns the event loop and one aiohttp session, so
+    connections stay alive across tool calls instead of being reopened.
+    An HttpCache, if given, is consulted before every request.
+    """
+
+    def __init__(self, api_key=None, search_url=SERPER_URL, top_n=TOP_RESULTS,
+                 max_connections=MAX_CONNECTIONS,
+                 max_connections_per_host=MAX_CONNECTIONS_PER_HOST,
+                 connect_timeout=CONNECT_TIMEOUT, request_timeout=REQUEST_TIMEOUT,
+                 cache=None):
+        self.api_key = api_key
+        self.search_url = search_url
+        self.top_n = top_n
+        self.cache = cache
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+        self.thread.start()
+        self.session = self.run(self.open_session(
+            max_connections, max_connections_per_host, connect_timeout,
+            request_timeout))
+
+    async def open_session(self, max_connections, max_connections_per_host,
+                           connect_timeout, request_timeout):
+        connector = aiohttp.TCPConnector(
+            limit=max_connections, limit_per_host=max_connections_per_host)
+        timeout = aiohttp.ClientTimeout(total=request_timeout,
+                                        sock_connect=connect_timeout)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout)
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def search_and_fetch(self, query, top_n=None):
+        return self.run(search_and_fetch(
+            self.session, query, self.api_key, top_n or self.top_n, self.search_url,
+            self.cache))
+
+    def fetch_article(self, url):
+        return self.run(fetch_article(self.session, url, cache=self.cache))
+
+    def close(self):
+        self.run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()